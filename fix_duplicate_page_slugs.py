@@ -4,23 +4,26 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'site_creator.settings')
 django.setup()
 
-from websites.models import Page
+from websites.models import Page, SlugAllocator
 from collections import defaultdict
 
 # Map: (website_id, slug) -> list of pages
 slug_map = defaultdict(list)
-for page in Page.objects.all():
+for page in Page.objects.order_by('id').only('id', 'website_id', 'slug'):
     slug_map[(page.website_id, page.slug)].append(page)
 
+# One allocator per website: its slugs are loaded once and new ones are tracked in memory
+allocators = {}
 for (website_id, slug), pages in slug_map.items():
     if len(pages) > 1:
         print(f"Duplicate slug: '{slug}' in website_id={website_id} (count: {len(pages)})")
-        for i, page in enumerate(pages):
-            if i == 0:
-                continue  # Keep the first occurrence as is
-            new_slug = f"{slug}-{i+1}"
+        if website_id not in allocators:
+            allocators[website_id] = SlugAllocator(website_id, preload=True)
+        for page in pages[1:]:  # Keep the first occurrence as is
+            new_slug = allocators[website_id].allocate(slug)
             print(f"Renaming page id={page.id} from '{slug}' to '{new_slug}' (website_id={website_id})")
+            page = Page.objects.get(pk=page.pk)
             page.slug = new_slug
             page.save()
 
-print("Duplicate slugs per website fixed.") 
\ No newline at end of file
+print("Duplicate slugs per website fixed.")
@@ -187,6 +187,9 @@ LOGOUT_REDIRECT_URL = 'account_login'
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 CKEDITOR_ALLOW_NONIMAGE_FILES = True
 CKEDITOR_FORCE_JPEG_COMPRESSION = False
+CKEDITOR_UPLOAD_MAX_WIDTH = int(os.getenv('CKEDITOR_UPLOAD_MAX_WIDTH', 2000))  # uploads wider than this are scaled down
+CKEDITOR_UPLOAD_BACKEND = os.getenv('CKEDITOR_UPLOAD_BACKEND', 'cloudinary')  # 'local' keeps finished uploads under MEDIA_ROOT
+UPLOAD_STAGING_ROOT = os.getenv('UPLOAD_STAGING_ROOT', os.path.join(BASE_DIR, 'upload_staging'))  # processed uploads awaiting the worker
 
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
@@ -194,6 +197,28 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # GitHub settings
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+GITHUB_REPO_CACHE_TTL = int(os.getenv('GITHUB_REPO_CACHE_TTL', 600))  # seconds before the cached repository list is refreshed
+GITHUB_PUBLISH_ENGINE = os.getenv('GITHUB_PUBLISH_ENGINE', 'git')  # 'git' pushes from a local clone, 'api' uses the Git Data API
+
+# Static site export
+EXPORT_CACHE_ROOT = os.getenv('EXPORT_CACHE_ROOT', os.path.join(BASE_DIR, 'export_cache'))  # persistent media cache
+EXPORT_FETCH_WORKERS = int(os.getenv('EXPORT_FETCH_WORKERS', 16))  # concurrent image downloads per export
+EXPORT_FETCH_PER_HOST = int(os.getenv('EXPORT_FETCH_PER_HOST', 6))  # max in-flight requests per host
+EXPORT_IMAGE_WIDTHS = [int(w) for w in os.getenv('EXPORT_IMAGE_WIDTHS', '480,960,1600').split(',')]  # responsive image variant widths
+BUILD_JOBS_EAGER = os.getenv('BUILD_JOBS_EAGER', 'False') == 'True'  # run exports/pushes in the request instead of run_build_worker
+
+# 'shared' is seen by the web processes and run_build_worker alike, so cached data
+# (nofollow sets, GitHub repository lists) and its invalidation reach all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DJANGO_CACHE_DIR', os.path.join(BASE_DIR, 'django_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
 
 CSRF_TRUSTED_ORIGINS = [
     "https://local-site-template.66.70.179.224.sslip.io",
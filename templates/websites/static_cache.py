@@ -0,0 +1,66 @@
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """
+    A per-process LRU (LocMemCache) in front of a FileBasedCache shared by all
+    workers. Misses in the LRU fall through to disk and are promoted. Meant for
+    values that never change under a given key, such as rendered pages keyed
+    by site version, since one worker cannot evict another worker's LRU.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local = LocMemCache(f'tiered:{location}', {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'OPTIONS': {'MAX_ENTRIES': options.get('LOCAL_MAX_ENTRIES', 1000)},
+        })
+        self.shared = FileBasedCache(location, {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'OPTIONS': {'MAX_ENTRIES': options.get('MAX_ENTRIES', 10000)},
+        })
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self.local.get(key, _MISSING)
+        if value is _MISSING:
+            value = self.shared.get(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if not self.shared.add(key, value, timeout):
+            return False
+        self.local.set(key, value, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.local.touch(key, timeout)
+        return self.shared.touch(key, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.local.delete(key)
+        return self.shared.delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.local.has_key(key) or self.shared.has_key(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
@@ -0,0 +1,25 @@
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+# slug -> {'id', 'title', 'is_homepage'}; page bodies stay on disk until requested
+with open(os.path.join(PAGES_DIR, 'index.json')) as f:
+    PAGE_INDEX = json.load(f)
+
+
+@lru_cache(maxsize=getattr(settings, 'PAGE_CACHE_SIZE', 256))
+def load_page(page_id):
+    with open(os.path.join(PAGES_DIR, f'{page_id}.json')) as f:
+        return json.load(f)
+
+
+def get_page(slug):
+    """Return the page stored under `slug`, or None. The result is shared and must not be modified."""
+    entry = PAGE_INDEX.get(slug)
+    if entry is None:
+        return None
+    return load_page(entry['id'])
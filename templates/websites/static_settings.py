@@ -95,22 +95,26 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Number of pages each worker keeps parsed in memory; the rest are read from static_site/pages on demand
+PAGE_CACHE_SIZE = 256
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# Redis Cache Configuration
+# Local two-tier cache: a per-process LRU in front of a file cache shared by
+# every worker on the host. Rendered pages are stored under the site version,
+# so entries never go stale and nothing outside this project is needed.
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': 'redis://66.70.179.224:5434/0',
+        'BACKEND': 'static_site.cache.TieredCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'TIMEOUT': None,
         'OPTIONS': {
-            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-            'USERNAME': 'default',
-            'PASSWORD': 'QRaBxWcYnEPztLy1Mahv3WOqieple5KEl4tOrtcb6MoOu1BkQoFmoWbMQakI3n28',
-        }
+            'MAX_ENTRIES': 10000,
+            'LOCAL_MAX_ENTRIES': 1000,
+        },
     }
 }
 
-# Use Redis cache for session storage
-SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
-SESSION_CACHE_ALIAS = 'default'
+# Sessions live in signed cookies so no shared session store is required
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
@@ -0,0 +1,24 @@
+from django.urls import path, re_path
+from django.conf import settings
+from django.conf.urls.static import static
+from django.views.generic import RedirectView
+from . import views
+
+urlpatterns = [
+    path('', views.home, name='home'),
+    path('home/', RedirectView.as_view(url='/')),
+    path('sitemap.xml', views.sitemap, name='sitemap'),
+    path('robots.txt', views.robots, name='robots'),
+    path('disclaimer/', views.disclaimer, name='disclaimer'),
+    path('privacy-policy/', views.privacy_policy, name='privacy_policy'),
+    path('terms-of-service/', views.terms_of_service, name='terms_of_service'),
+    path('contact/', views.contact, name='contact'),
+    # Every content page, including nested slugs like "services/roofing", is
+    # looked up in the page index by views.page
+    re_path(r'^(?P<slug>.+)/$', views.page, name='page'),
+]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+handler404 = views.page_not_found
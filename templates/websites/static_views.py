@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+from functools import wraps
+from django.core.cache import cache
+from django.shortcuts import render, redirect
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from .static_data import SITE_VERSION, SITE_UPDATED, WEBSITE, NAV_PAGES, HOMEPAGE_SLUG, HEADER_MENU, FOOTER_MENU
+from .page_store import PAGE_INDEX, get_page
+
+LAST_MODIFIED = datetime.fromtimestamp(SITE_UPDATED, tz=timezone.utc)
+
+
+def is_search_bot(request):
+    user_agent = request.META.get('HTTP_USER_AGENT', '').lower()
+    return 'googlebot' in user_agent or 'bingbot' in user_agent
+
+def site_etag(request, *args, **kwargs):
+    # Pages omit analytics for search bots, so bots get their own variant
+    return f'{SITE_VERSION}-{int(is_search_bot(request))}'
+
+def site_last_modified(request, *args, **kwargs):
+    return LAST_MODIFIED
+
+def cached_response(view):
+    """
+    Answer conditional GETs with 304 and serve full responses from the cache,
+    rendering each page once per site version and crawler/visitor variant.
+    """
+    @condition(etag_func=site_etag, last_modified_func=site_last_modified)
+    def conditional(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        key = f'response:{site_etag(request)}:{request.path}'
+        cached = cache.get(key)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            cached = (response.content, response['Content-Type'])
+            cache.set(key, cached)
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    # The ETag and the cached body both depend on the crawler/visitor variant,
+    # so every response says so, 304s included
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        patch_vary_headers(response, ['User-Agent'])
+        return response
+    return wrapper
+
+
+def page_not_found(request, exception=None):
+    return render(request, '404.html', {
+        'website': WEBSITE,
+        'page': {'title': 'Page Not Found'},
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES
+    }, status=404)
+
+def render_static_page(request, context):
+    # The quote form posts to Web3Forms, so no CSRF token is rendered; pages are
+    # then identical for every visitor and safe to serve from the cache
+    return render(request, 'static_page.html', dict(context, csrf_token='NOTPROVIDED'))
+
+# Alt text, lazy loading, nofollow links and the per-page schema are all
+# computed when the site is exported, so serving a page does no HTML parsing.
+def render_page(request, page_data):
+    if page_data is None:
+        return page_not_found(request)
+    return render_static_page(request, {
+        'website': WEBSITE,
+        'page': page_data,
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES,
+        'global_schema': WEBSITE.get('global_seo_schema', ''),
+        'per_page_schema': page_data['schema'],
+        'is_search_bot': is_search_bot(request)
+    })
+
+@cached_response
+def home(request):
+    return render_page(request, get_page(HOMEPAGE_SLUG))
+
+@cached_response
+def page(request, slug):
+    if slug == HOMEPAGE_SLUG:
+        return redirect('/', permanent=True)
+    return render_page(request, get_page(slug))
+
+@cached_response
+def sitemap(request):
+    return render(request, 'sitemap.xml', {
+        'website': WEBSITE,
+        'pages': PAGE_INDEX
+    }, content_type='application/xml')
+
+@cached_response
+def robots(request):
+    content = 'User-agent: *\nAllow: /\nSitemap: https://' + WEBSITE["domain"] + '/sitemap.xml'
+    return HttpResponse(content, content_type='text/plain')
+
+@cached_response
+def disclaimer(request):
+    return render_static_page(request, {
+        'website': WEBSITE,
+        'page': {'title': 'Disclaimer', 'content': 'This is the disclaimer page.'},
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES
+    })
+
+@cached_response
+def privacy_policy(request):
+    return render_static_page(request, {
+        'website': WEBSITE,
+        'page': {'title': 'Privacy Policy', 'content': 'This is the privacy policy page.'},
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES
+    })
+
+@cached_response
+def terms_of_service(request):
+    return render_static_page(request, {
+        'website': WEBSITE,
+        'page': {'title': 'Terms of Service', 'content': 'This is the terms of service page.'},
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES
+    })
+
+@cached_response
+def contact(request):
+    content_string = 'Contact us at ' + WEBSITE["phone_number_display"]
+    return render_static_page(request, {
+        'website': WEBSITE,
+        'page': {'title': 'Contact', 'content': content_string},
+        'header_menu': HEADER_MENU,
+        'footer': FOOTER_MENU,
+        'all_pages': NAV_PAGES
+    })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Website, Page, Menu, Author
+from .models import Website, Page, Menu, Author, BuildJob, UploadedAsset
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django import forms
 from .forms import MenuForm
@@ -41,3 +41,15 @@ admin.site.register(Menu, MenuAdmin)
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('name', 'url')
     search_fields = ('name',)
+
+@admin.register(BuildJob)
+class BuildJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'website', 'kind', 'status', 'stage', 'progress', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'updated_at', 'started_at', 'finished_at')
+
+@admin.register(UploadedAsset)
+class UploadedAssetAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'website', 'status', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
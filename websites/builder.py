@@ -0,0 +1,930 @@
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.template import Context, Engine
+from django.template.loader import render_to_string
+
+from .images import PLACEHOLDER_VERSION, ResponsiveImages
+from .media import MediaCache, cache_field_file, download_and_rewrite_pages, fetch_cached_file, media_url, variant_files
+from .models import nofollow_urls
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds of the same website are not serialized
+    fcntl = None
+
+# Bump whenever the generated project layout changes so every site gets a full rebuild.
+BUILD_VERSION = 3
+
+STATIC_FILES = ['css/bootstrap.min.css', 'js/bootstrap.bundle.min.js']
+HERO_WIDTHS = [640, 1024, 1600, 1920]
+TEMPLATE_FILES = ['static_base.html', 'static_page.html', '404.html', 'sitemap.xml']
+GENERATOR_TEMPLATES = ['static_settings.py', 'static_urls.py', 'static_views.py', 'static_page_store.py', 'static_cache.py']
+
+MANAGE_PY = '''#!/usr/bin/env python
+import os
+import sys
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "static_site.settings")
+    try:
+        from django.core.management import execute_from_command_line
+    except ImportError as exc:
+        raise ImportError(
+            "Couldn't import Django. Are you sure it's installed?"
+        ) from exc
+    execute_from_command_line(sys.argv)
+'''
+
+WSGI_PY = '''import os
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'static_site.settings')
+application = get_wsgi_application()
+'''
+
+ASGI_PY = '''import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'static_site.settings')
+application = get_asgi_application()
+'''
+
+# Formats that are already compressed are stored as-is in export archives.
+PRECOMPRESSED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif', '.ico', '.zip', '.gz', '.woff', '.woff2'}
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Pages that exist on every exported site besides the website's own pages.
+LEGAL_PAGES = [
+    ('disclaimer', 'Disclaimer', 'This is the disclaimer page.'),
+    ('privacy-policy', 'Privacy Policy', 'This is the privacy policy page.'),
+    ('terms-of-service', 'Terms of Service', 'This is the terms of service page.'),
+]
+
+HTML_NGINX_CONF = '''server {{
+    listen 80;
+    server_name {domain} www.{domain};
+    root /var/www/{domain};
+    index index.html;
+
+    location / {{
+        try_files $uri $uri/ =404;
+    }}
+    location = /home/ {{
+        return 301 /;
+    }}
+    location ~ ^/(media|static)/ {{
+        expires 1y;
+        add_header Cache-Control "public";
+    }}
+    error_page 404 /404.html;
+}}
+'''
+
+HOME_REDIRECT_HTML = '''<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8"><meta http-equiv="refresh" content="0; url=/"><link rel="canonical" href="/"><title>Redirecting</title></head>
+<body><a href="/">Continue to the homepage</a></body></html>
+'''
+
+REQUIREMENTS_TXT = 'Django==5.0.2\nPillow==10.2.0\ngunicorn\n'
+HEADERS_FILE = '/media/*\nCache-Control: public, max-age=31536000'
+NGINX_CONF = 'location /media/ {\nexpires 1y;\nadd_header Cache-Control "public";\n} '
+
+
+def hex_to_rgba(hex_color, alpha=0.5):
+    hex_color = hex_color.lstrip('#')
+    lv = len(hex_color)
+    if lv == 6:
+        rgb = tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+    elif lv == 3:
+        rgb = tuple(int(hex_color[i]*2, 16) for i in range(3))
+    else:
+        return f'rgba(20, 128, 138, {alpha})'  # fallback
+    return f'rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, {alpha})'
+
+
+def parse_menu_markdown(md):
+    # Returns a dict: {'paragraphs': [...], 'links': [menu structure]}
+    lines = md.splitlines()
+    stack = []
+    root = []
+    paragraphs = []
+    for line in lines:
+        if not line.strip():
+            continue
+        depth = 0
+        orig_line = line
+        while line.startswith('\t'):
+            depth += 1
+            line = line[1:]
+        m = re.match(r'\[(.*?)\]\((.*?)\)', line.strip())
+        if m:
+            title, url = m.groups()
+            # Normalize URL: if not empty and not external, ensure starts with '/'
+            if url and not url.startswith(('http://', 'https://', '/')):
+                url = '/' + url.lstrip('/')
+            node = {'title': title, 'url': url, 'children': []}
+            if depth == 0:
+                root.append(node)
+                stack = [node]
+            else:
+                if len(stack) >= depth:
+                    stack = stack[:depth]
+                if stack:
+                    stack[-1]['children'].append(node)
+                stack.append(node)
+        else:
+            # Not a link, treat as paragraph
+            if depth == 0:
+                paragraphs.append(orig_line.strip())
+    return {'paragraphs': paragraphs, 'links': root}
+
+
+def parse_social_links(markdown_text):
+    pattern = r'\[([^\]]+)\]\(([^)]+)\)'
+    return [{'title': m[0], 'url': m[1]} for m in re.findall(pattern, markdown_text or "")]
+
+
+def get_file_local_path_or_download(field, dest_path):
+    """
+    If the file is stored locally, return its path.
+    If stored in cloud (no .path), download from .url to dest_path and return dest_path.
+    """
+    if field:
+        try:
+            file_path = field.path
+            if os.path.exists(file_path):
+                return file_path
+        except Exception:
+            try:
+                return fetch_cached_file(field.url, dest_path)
+            except Exception:
+                pass
+    return None
+
+
+def filename_to_alt(filename):
+    base = os.path.basename(filename)
+    name, _ = os.path.splitext(base)
+
+    # Try to find content in first set of parentheses
+    match = re.search(r'\(([^)]+)\)', name)
+    if match:
+        text = match.group(1)
+    else:
+        text = name
+
+    # Replace underscores with spaces and capitalize each word
+    return " ".join(word.capitalize() for word in text.replace("_", " ").split())
+
+
+def add_nofollow(soup, nofollow_urls):
+    """Add rel="nofollow" to <a> tags whose href is in the set nofollow_urls (see models.nofollow_urls)."""
+    for a in soup.find_all("a", href=True):
+        if a['href'] in nofollow_urls:
+            rel = a.get('rel', [])
+            if isinstance(rel, str):
+                rel = rel.split()
+            if "nofollow" not in rel:
+                rel.append("nofollow")
+            a['rel'] = " ".join(rel)
+
+
+def split_paragraphs(content):
+    return [para.strip() for para in re.split(r'<br ?/?>|\n', content) if para.strip() and para.strip() != '&nbsp;']
+
+
+def page_schema(website_data, page_data, slug):
+    """The per-page Article JSON-LD that the exported views emit."""
+    return json.dumps({
+        "@context": "https://schema.org",
+        "@type": "Article",
+        "headline": page_data.get('title', ''),
+        "description": page_data.get('content', '')[:150] if 'content' in page_data else '',
+        "datePublished": page_data.get('date_published', ''),
+        "dateModified": page_data.get('date_modified', ''),
+        "author": {
+            "@type": "Organization",
+            "name": website_data.get('name', '')
+        },
+        "publisher": {
+            "@type": "Organization",
+            "name": website_data.get('name', ''),
+            "logo": {
+                "@type": "ImageObject",
+                "url": website_data.get('logo', '')
+            }
+        },
+        "mainEntityOfPage": {
+            "@type": "WebPage",
+            "@id": website_data.get('domain', '') + '/' + slug
+        }
+    }, ensure_ascii=False, indent=2)
+
+
+def finalize_page_entry(entry, slug, website_data, nofollow_urls):
+    """
+    Apply the per-request work of the exported views once, at build time:
+    alt text and lazy loading on images, rel="nofollow" on links to nofollow
+    pages, and the page's JSON-LD schema. `slug` is '' for the homepage.
+    """
+    soup = BeautifulSoup(entry['content'], "html.parser")
+    for img in soup.find_all("img"):
+        if not img.has_attr("alt") or not img["alt"]:
+            img["alt"] = filename_to_alt(img.get("src", ""))
+            img["loading"] = "lazy"
+    if nofollow_urls:
+        add_nofollow(soup, nofollow_urls)
+    content = str(soup)
+    final = dict(entry, content=content, paragraphs=split_paragraphs(content))
+    final['schema'] = page_schema(website_data, final, slug)
+    return final
+
+
+def export_template_engine():
+    """A template engine that resolves the exported site's templates the way the generated project does."""
+    return Engine(
+        dirs=[os.path.join(settings.BASE_DIR, 'templates', 'websites')],
+        libraries={'static': 'django.templatetags.static'},
+    )
+
+
+def mirror_tree(src, dest, keep=()):
+    """
+    Make `dest` hold the same files as `src`, hard-linking where possible and
+    removing files that no longer exist in `src`. Top-level entries of `dest`
+    named in `keep` (e.g. '.git') are left alone.
+    """
+    wanted = set()
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        os.makedirs(os.path.join(dest, rel_root), exist_ok=True)
+        for name in files:
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            wanted.add(rel_path)
+            src_path = os.path.join(src, rel_path)
+            dest_path = os.path.join(dest, rel_path)
+            if os.path.exists(dest_path):
+                if os.path.samefile(src_path, dest_path):
+                    continue
+                os.remove(dest_path)
+            try:
+                os.link(src_path, dest_path)
+            except OSError:
+                shutil.copy2(src_path, dest_path)
+    for root, dirs, files in os.walk(dest):
+        if root == dest:
+            dirs[:] = [name for name in dirs if name not in keep]
+            files = [name for name in files if name not in keep]
+        for name in files:
+            rel_path = os.path.normpath(os.path.relpath(os.path.join(root, name), dest))
+            if rel_path not in wanted:
+                os.remove(os.path.join(root, name))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def json_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def write_if_changed(path, content):
+    """Write `content` to `path` unless the file already holds exactly that. Returns True if written."""
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    return True
+
+
+def copy_if_changed(src_path, dest_path):
+    """Copy `src_path` to `dest_path` unless size and mtime already match. Returns True if copied."""
+    src_stat = os.stat(src_path)
+    try:
+        dest_stat = os.stat(dest_path)
+        if dest_stat.st_size == src_stat.st_size and dest_stat.st_mtime_ns == src_stat.st_mtime_ns:
+            return False
+    except OSError:
+        pass
+    shutil.copy2(src_path, dest_path)
+    return True
+
+
+def sync_tree(src, dest):
+    """Copy files from `src` into `dest`, skipping files whose size and mtime already match."""
+    for root, dirs, files in os.walk(src):
+        dest_root = os.path.join(dest, os.path.relpath(root, src))
+        os.makedirs(dest_root, exist_ok=True)
+        for name in files:
+            copy_if_changed(os.path.join(root, name), os.path.join(dest_root, name))
+
+
+def build_root(website_id):
+    return os.path.join(settings.EXPORT_CACHE_ROOT, 'builds', f'website_{website_id}')
+
+
+def discard_build(website_id):
+    """Remove the cached build of a website, e.g. after it has been deleted."""
+    shutil.rmtree(build_root(website_id), ignore_errors=True)
+
+
+@contextmanager
+def build_lock(website_id):
+    os.makedirs(build_root(website_id), exist_ok=True)
+    with open(os.path.join(build_root(website_id), 'lock'), 'w') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SiteBuilder:
+    """
+    Builds the exported Django project for a website into a persistent
+    directory under EXPORT_CACHE_ROOT/builds/website_<id>/site.
+
+    Each build records a manifest holding a hash of every global input
+    (website settings, author, menus, generator templates, static files) and
+    one hash per page. The next build reuses the previous output: only pages
+    whose hash changed are re-processed (image download and rewrite), media
+    no longer referenced by any page is pruned, and generated files are only
+    rewritten when their content differs. Any change to a global input falls
+    back to a full rebuild.
+    """
+
+    def __init__(self, website, progress=None, mode='django'):
+        self.website = website
+        self.progress = progress or (lambda stage, percent: None)
+        self.mode = mode
+        self.root = build_root(website.id)
+        self.site_dir = os.path.join(self.root, 'site')
+        self.html_dir = os.path.join(self.root, 'html')
+        self.pages_dir = os.path.join(self.root, 'pages')
+        self.manifest_path = os.path.join(self.root, 'manifest.json')
+        self.media_dir = os.path.join(self.site_dir, 'media')
+        self.stats = {'full_rebuild': False, 'pages_processed': 0, 'pages_reused': 0, 'files_written': 0, 'pages_rendered': 0}
+
+    # -- inputs -------------------------------------------------------------
+
+    def menus(self):
+        menus = {menu.type: menu.content for menu in self.website.menus.all()}
+        return menus.get('header', ''), menus.get('footer', '')
+
+    def global_inputs(self):
+        website = self.website
+        fields = {}
+        for field in website._meta.concrete_fields:
+            if field.name in ('created_at', 'updated_at'):
+                continue
+            value = field.value_from_object(website)
+            fields[field.name] = getattr(value, 'name', value)
+        author = website.author
+        generator_files = {}
+        for name in GENERATOR_TEMPLATES + TEMPLATE_FILES:
+            path = os.path.join(settings.BASE_DIR, 'templates', 'websites', name)
+            generator_files[name] = file_digest(path) if os.path.exists(path) else None
+        for name in STATIC_FILES:
+            path = os.path.join(settings.STATIC_ROOT, name)
+            generator_files[name] = file_digest(path) if os.path.exists(path) else None
+        return {
+            'version': BUILD_VERSION,
+            'website': fields,
+            'author': {
+                'name': author.name,
+                'logo': author.logo.name if author.logo else '',
+                'description': author.description,
+                'image': author.image,
+                'url': author.url,
+            } if author else None,
+            'menus': self.menus(),
+            'generator': generator_files,
+            'web3_form_api_key': os.getenv('WEB3_FORM_API_KEY', ''),
+            'images': [ResponsiveImages().key, PLACEHOLDER_VERSION, HERO_WIDTHS],
+        }
+
+    @staticmethod
+    def page_hash(page):
+        return json_digest({
+            'updated_at': page.updated_at.isoformat() if page.updated_at else '',
+            'title': page.title,
+            'content': page.content,
+            'slug': page.slug,
+            'is_homepage': page.is_homepage,
+            'date_published': page.date_published.isoformat() if page.date_published else '',
+            'date_modified': page.date_modified.isoformat() if page.date_modified else '',
+            'breadcrumb': page.breadcrumb,
+        })
+
+    # -- manifest -----------------------------------------------------------
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_manifest(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # -- build steps --------------------------------------------------------
+
+    def write(self, relpath, content):
+        if write_if_changed(os.path.join(self.site_dir, relpath), content):
+            self.stats['files_written'] += 1
+
+    def build_global_assets(self):
+        """Copy static files and templates and prepare site-wide images. Returns exported asset paths."""
+        website = self.website
+        for static_file in STATIC_FILES:
+            src_path = os.path.join(settings.STATIC_ROOT, static_file)
+            if os.path.exists(src_path):
+                dest_path = os.path.join(self.site_dir, 'static', static_file)
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                shutil.copy2(src_path, dest_path)
+        templates_dir = os.path.join(self.site_dir, 'templates')
+        os.makedirs(templates_dir, exist_ok=True)
+        for template_file in TEMPLATE_FILES:
+            src_path = os.path.join(settings.BASE_DIR, 'templates', 'websites', template_file)
+            if os.path.exists(src_path):
+                shutil.copy2(src_path, os.path.join(templates_dir, template_file))
+
+        top_image_dest_dir = os.path.join(self.media_dir, 'websites')
+        os.makedirs(top_image_dest_dir, exist_ok=True)
+        assets = {'favicon': '', 'logo': '', 'author_logo': '', 'hero': self.build_hero(top_image_dest_dir)}
+        fields = {'favicon': website.favicon, 'logo': website.logo}
+        if website.author:
+            fields['author_logo'] = website.author.logo
+        for key, field in fields.items():
+            if field:
+                dest = os.path.join(top_image_dest_dir, os.path.basename(str(field.name)))
+                if get_file_local_path_or_download(field, dest) and os.path.exists(dest):
+                    assets[key] = media_url(os.path.basename(dest))
+        return assets
+
+    def build_hero(self, dest_dir):
+        """
+        Export the hero background as EXIF-free WebP/AVIF and progressive JPEG
+        derivatives at HERO_WIDTHS, and return what the templates need to offer
+        them (srcsets, size, placeholder), or None when there is no hero image.
+        Derivatives are cached by the source's content, so they are only
+        re-encoded when the image itself changes.
+        """
+        cache = MediaCache()
+        filename = None
+        if self.website.heading_background_image:
+            filename = cache_field_file(self.website.heading_background_image, 'title-background', cache)
+        if not filename:
+            default_path = os.path.join(settings.MEDIA_ROOT, 'websites', 'title-background.jpg')
+            if not os.path.exists(default_path):
+                return None
+            filename = cache.add_file(default_path, 'title-background')
+        info = ResponsiveImages(cache, widths=HERO_WIDTHS, profile='hero-').prepare(filename)
+        if not info or not info['variants']:
+            return None
+
+        record = info['variants']
+        for name in variant_files(record):
+            cache.materialize(name, os.path.join(dest_dir, name))
+
+        def srcset(candidates):
+            return ', '.join(f'{media_url(name)} {width}w' for width, name in candidates)
+
+        fallback = record['sources'][record['fallback']]
+        sources = [
+            {'type': mime, 'srcset': srcset(candidates)}
+            for mime, candidates in record['sources'].items() if mime != record['fallback']
+        ]
+        return {
+            'width': info['width'],
+            'height': info['height'],
+            'placeholder': info['placeholder'],
+            'src': media_url(fallback[-1][1]),
+            'srcset': srcset(fallback),
+            'sources': sources,
+            # Preload the best format offered; browsers skip preloads of types they cannot decode
+            'preload': sources[0] if sources else {'type': record['fallback'], 'srcset': srcset(fallback)},
+        }
+
+    def process_pages(self, pages, previous):
+        """
+        Rewrite changed pages, reuse cached output for the rest. Pages whose
+        images could not all be fetched last time are rewritten again.
+        Returns (page entries, page manifest).
+        """
+        changed = [
+            p for p in pages
+            if previous.get(str(p.id), {}).get('hash') != self.page_hash(p)
+            or not previous[str(p.id)].get('complete', True)
+            or not os.path.exists(os.path.join(self.pages_dir, f'{p.id}.json'))
+        ]
+        rewritten = download_and_rewrite_pages(changed, self.media_dir, responsive=ResponsiveImages()) if changed else {}
+        os.makedirs(self.pages_dir, exist_ok=True)
+        entries = {}
+        page_manifest = {}
+        for page in pages:
+            cache_path = os.path.join(self.pages_dir, f'{page.id}.json')
+            if page.id in rewritten:
+                new_content = rewritten[page.id]['content']
+                entry = {
+                    'title': page.title,
+                    'content': new_content,
+                    'is_homepage': page.is_homepage,
+                    'date_published': page.date_published.isoformat() if page.date_published else '',
+                    'date_modified': page.date_modified.isoformat() if page.date_modified else '',
+                    'breadcrumb': page.breadcrumb,
+                    'paragraphs': split_paragraphs(new_content),
+                }
+                media = rewritten[page.id]['media']
+                complete = rewritten[page.id]['complete']
+                with open(cache_path, 'w') as f:
+                    json.dump(entry, f)
+                self.stats['pages_processed'] += 1
+            else:
+                with open(cache_path) as f:
+                    entry = json.load(f)
+                media = previous[str(page.id)]['media']
+                complete = True
+                self.stats['pages_reused'] += 1
+            entries[page.slug] = entry
+            page_manifest[str(page.id)] = {'hash': self.page_hash(page), 'slug': page.slug, 'media': media, 'complete': complete}
+
+        # Drop cached output and media that no current page references any more
+        for page_id in set(previous) - set(page_manifest):
+            try:
+                os.remove(os.path.join(self.pages_dir, f'{page_id}.json'))
+            except OSError:
+                pass
+        still_used = {name for record in page_manifest.values() for name in record['media']}
+        for record in previous.values():
+            for name in set(record['media']) - still_used:
+                try:
+                    os.remove(os.path.join(self.media_dir, 'websites', name))
+                except OSError:
+                    pass
+        return entries, page_manifest
+
+    def finalize_pages(self, pages, entries, page_manifest, previous, website_data, homepage_slug):
+        """
+        Run the build-time HTML pass (see finalize_page_entry) over every page,
+        reusing the stored result when neither the page nor the inputs shared by
+        all pages changed. Returns the final page entries keyed by slug and
+        records the per-page key in `page_manifest`.
+        """
+        shared = {
+            'nofollow_urls': website_data['NOFOLLOW_URLS'],
+            'name': website_data.get('name', ''),
+            'logo': website_data.get('logo', ''),
+            'domain': website_data.get('domain', ''),
+            'homepage_slug': homepage_slug,
+        }
+        final_entries = {}
+        for page in pages:
+            record = page_manifest[str(page.id)]
+            # The media a page got also shapes its content when earlier fetches failed
+            key = json_digest([record['hash'], record['media'], record['complete'], shared])
+            final_path = os.path.join(self.pages_dir, f'{page.id}.final.json')
+            if previous.get(str(page.id), {}).get('final') == key and os.path.exists(final_path):
+                with open(final_path) as f:
+                    final = json.load(f)
+            else:
+                schema_slug = '' if page.slug == homepage_slug else page.slug
+                final = finalize_page_entry(entries[page.slug], schema_slug, website_data, self.nofollow)
+                with open(final_path, 'w') as f:
+                    json.dump(final, f)
+            record['final'] = key
+            final_entries[page.slug] = final
+        for page_id in set(previous) - set(page_manifest):
+            try:
+                os.remove(os.path.join(self.pages_dir, f'{page_id}.final.json'))
+            except OSError:
+                pass
+        return final_entries
+
+    def write_page_store(self, pages):
+        """
+        Export the page store read by the generated page_store module: one
+        JSON file per page under static_site/pages, plus index.json mapping
+        each slug to its page id, title and homepage flag.
+        """
+        store_dir = os.path.join(self.site_dir, 'static_site', 'pages')
+        os.makedirs(store_dir, exist_ok=True)
+        index = {}
+        for page in pages:
+            index[page.slug] = {'id': page.id, 'title': page.title, 'is_homepage': page.is_homepage}
+            if copy_if_changed(os.path.join(self.pages_dir, f'{page.id}.final.json'), os.path.join(store_dir, f'{page.id}.json')):
+                self.stats['files_written'] += 1
+        self.write('static_site/pages/index.json', json.dumps(index))
+        wanted = {f'{page.id}.json' for page in pages} | {'index.json'}
+        for name in set(os.listdir(store_dir)) - wanted:
+            os.remove(os.path.join(store_dir, name))
+
+    def build(self, force=False):
+        """Bring the build directory up to date and return the path of the output for this mode."""
+        with build_lock(self.website.id):
+            return self._build(force)
+
+    def _build(self, force):
+        website = self.website
+        global_inputs = self.global_inputs()
+        global_hash = json_digest(global_inputs)
+        manifest = self.load_manifest()
+        if force or not manifest or manifest.get('global') != global_hash or not os.path.isdir(self.site_dir):
+            self.stats['full_rebuild'] = True
+            self.progress('Preparing site assets', 5)
+            shutil.rmtree(self.site_dir, ignore_errors=True)
+            shutil.rmtree(self.pages_dir, ignore_errors=True)
+            shutil.rmtree(self.html_dir, ignore_errors=True)
+            manifest = {'global': global_hash, 'assets': self.build_global_assets(), 'pages': {}}
+
+        ckeditor_upload_source_path = os.path.join(settings.MEDIA_ROOT, settings.CKEDITOR_UPLOAD_PATH)
+        if os.path.exists(ckeditor_upload_source_path):
+            sync_tree(ckeditor_upload_source_path, os.path.join(self.media_dir, settings.CKEDITOR_UPLOAD_PATH))
+
+        pages = list(website.pages.all())
+        self.progress(f'Processing {len(pages)} pages', 20)
+        previous_pages = manifest['pages']
+        pages_dict, manifest['pages'] = self.process_pages(pages, previous_pages)
+        homepage = next((p for p in pages if p.is_homepage), pages[0] if pages else None)
+
+        export_form_options1 = website.form_options1
+        if not export_form_options1 or (isinstance(export_form_options1, str) and export_form_options1.strip() == ''):
+            export_form_options1 = [p.title for p in pages if not p.is_homepage]
+        else:
+            export_form_options1 = [opt.strip() for opt in export_form_options1.split('\n') if opt.strip()]
+        export_form_options2 = website.form_options2
+        if not export_form_options2 or (isinstance(export_form_options2, str) and export_form_options2.strip() == ''):
+            export_form_options2 = ['Less than 300', 'Between 300-500', 'More than 500']
+        else:
+            export_form_options2 = [opt.strip() for opt in export_form_options2.split('\n') if opt.strip()]
+        header_menu_content, footer_menu_content = global_inputs['menus']
+        assets = manifest['assets']
+        self.nofollow = nofollow_urls(website.id)
+        static_data_dict = {
+            'name': website.name,
+            'domain': website.domain,
+            'phone_number_display': website.phone_number_display,
+            'phone_number_link': website.phone_number_link,
+            'robots_txt': website.robots_txt,
+            'github_repo': website.github_repo,
+            'is_public_repo': website.is_public_repo,
+            'form_cta1': website.form_cta1,
+            'form_cta2': website.form_cta2,
+            'form_question1': website.form_question1,
+            'form_question2': website.form_question2,
+            'form_options1': export_form_options1,
+            'form_options2': export_form_options2,
+            'form_quote_button': website.form_quote_button,
+            'form_name_label': website.form_name_label,
+            'form_phone_label': website.form_phone_label,
+            'form_email_label': website.form_email_label,
+            'footer_phone_cta': website.footer_phone_cta,
+            'footer_legal_disclaimer': website.footer_legal_disclaimer,
+            'google_search_console_tag': website.google_search_console_tag,
+            'google_tag': website.google_tag,
+            'meta_facebook_pixel': website.meta_facebook_pixel,
+            'google_analytics': website.google_analytics,
+            'social_links': parse_social_links(website.social_media_box),
+            'favicon': assets['favicon'],
+            'logo': assets['logo'],
+            'author': {
+                'name': website.author.name if website.author else '',
+                'logo': assets['author_logo'],
+                'description': website.author.description if website.author else '',
+                'image': website.author.image if website.author else '',
+                'url': website.author.url if website.author else '',
+            },
+            'global_seo_schema': website.global_seo_schema,
+            'WEB3_FORM_API_KEY': global_inputs['web3_form_api_key'],
+            'NOFOLLOW_URLS': sorted(self.nofollow),
+            'header_box_color': website.header_box_color or "#14808a55",
+            'phone_banner_bg_color': website.phone_banner_bg_color or '#14808a',
+            'contact_box_color': website.contact_box_color or "#24d16cff",
+            'header_box_rgba': hex_to_rgba(website.header_box_color or '#14808a', 0.5),
+            'hero': assets.get('hero'),
+        }
+        pages_dict = self.finalize_pages(
+            pages, pages_dict, manifest['pages'], previous_pages, static_data_dict, homepage.slug if homepage else ''
+        )
+        header_menu_parsed = parse_menu_markdown(header_menu_content)
+        footer_menu_parsed = parse_menu_markdown(footer_menu_content)
+        # Everything the templates need to list pages, without any page bodies
+        nav_pages = [
+            {'title': p.title, 'slug': p.slug, 'url': '/' if p.is_homepage else f'/{p.slug}/', 'is_homepage': p.is_homepage}
+            for p in pages
+        ]
+        # Identifies this exact build of the site; the exported views key their
+        # response cache and ETags on it, and SITE_UPDATED drives Last-Modified.
+        site_version = json_digest([
+            global_hash, static_data_dict, nav_pages, sorted(record['final'] for record in manifest['pages'].values()),
+        ])[:16]
+        previous_site = manifest.get('site') or {}
+        if previous_site.get('version') == site_version:
+            manifest['site'] = previous_site
+        else:
+            manifest['site'] = {'version': site_version, 'updated': int(time.time())}
+        static_data_content = (
+            "# Website data\n"
+            f"SITE_VERSION = {repr(site_version)}\n"
+            f"SITE_UPDATED = {manifest['site']['updated']}\n"
+            f"WEBSITE = {repr(static_data_dict)}\n"
+            f"NAV_PAGES = {repr(tuple(nav_pages))}\n"
+            f"HOMEPAGE_SLUG = {repr(homepage.slug if homepage else '')}\n"
+            f"HEADER_MENU = {repr(header_menu_parsed)}\n"
+            f"FOOTER_MENU = {repr(footer_menu_parsed)}\n"
+        )
+
+        self.progress('Writing project files', 90)
+        self.write('static_site/settings.py', render_to_string('websites/static_settings.py', {'website': website}))
+        self.write('static_site/urls.py', render_to_string('websites/static_urls.py'))
+        self.write('static_site/views.py', render_to_string('websites/static_views.py'))
+        self.write('static_site/static_data.py', static_data_content)
+        self.write('static_site/page_store.py', render_to_string('websites/static_page_store.py'))
+        self.write('static_site/cache.py', render_to_string('websites/static_cache.py'))
+        self.write_page_store(pages)
+        self.write('static_site/__init__.py', '')
+        self.write('static_site/wsgi.py', WSGI_PY)
+        self.write('static_site/asgi.py', ASGI_PY)
+        self.write('robots.txt', f'User-agent: *\\nAllow: /\\nSitemap: https://{website.domain}/sitemap.xml')
+        self.write('manage.py', MANAGE_PY)
+        self.write('requirements.txt', REQUIREMENTS_TXT)
+        self.write('_headers', HEADERS_FILE)
+        self.write('nginx.conf', NGINX_CONF)
+
+        output_dir = self.site_dir
+        if self.mode == 'html':
+            self.progress('Rendering HTML pages', 92)
+            manifest['html'] = self.render_html(manifest.get('html') or {}, {
+                'website': static_data_dict,
+                'pages': pages_dict,
+                'nav_pages': nav_pages,
+                'homepage_slug': homepage.slug if homepage else '',
+                'header_menu': header_menu_parsed,
+                'footer': footer_menu_parsed,
+            })
+            output_dir = self.html_dir
+
+        manifest['version'] = BUILD_VERSION
+        self.save_manifest(manifest)
+        return output_dir
+
+    def render_html(self, previous, data):
+        """
+        Pre-render every page of the site to plain files under the html build
+        directory, so any static host can serve it without Python. Pages are
+        re-rendered only when their own data or the data shared by every page
+        (site settings, menus, page list) changed. Returns the html manifest.
+        """
+        engine = export_template_engine()
+        website_data = data['website']
+        pages = data['pages']
+        all_pages = data['nav_pages']
+        shared = {
+            'website': website_data,
+            'header_menu': data['header_menu'],
+            'footer': data['footer'],
+        }
+        shared_hash = json_digest([shared, all_pages, data['homepage_slug']])
+        reuse = previous.get('shared') == shared_hash
+        rendered = {}
+
+        def write_html(relpath, content):
+            if write_if_changed(os.path.join(self.html_dir, relpath), content):
+                self.stats['files_written'] += 1
+
+        def render_page(template, page_data, **extra):
+            # The quote form posts to Web3Forms, so there is no CSRF token to render
+            context = dict(shared, page=page_data, all_pages=all_pages, is_search_bot=False, csrf_token='NOTPROVIDED', **extra)
+            return engine.get_template(template).render(Context(context))
+
+        for slug, entry in pages.items():
+            is_home = slug == data['homepage_slug']
+            key = '' if is_home else slug
+            page_hash = json_digest(entry)
+            rendered[key] = page_hash
+            if reuse and previous.get('pages', {}).get(key) == page_hash:
+                continue
+            html = render_page(
+                'static_page.html', entry,
+                global_schema=website_data.get('global_seo_schema', ''),
+                per_page_schema=entry['schema'],
+            )
+            write_html(os.path.join(key, 'index.html'), html)
+            self.stats['pages_rendered'] += 1
+
+        # Drop pages that no longer exist, along with directories left empty
+        for key in set(previous.get('pages', {})) - set(rendered):
+            try:
+                os.remove(os.path.join(self.html_dir, key, 'index.html'))
+                os.removedirs(os.path.join(self.html_dir, key))
+            except OSError:
+                pass
+
+        for slug, title, content in LEGAL_PAGES:
+            write_html(os.path.join(slug, 'index.html'), render_page('static_page.html', {'title': title, 'content': content}))
+        contact = {'title': 'Contact', 'content': 'Contact us at ' + website_data['phone_number_display']}
+        write_html(os.path.join('contact', 'index.html'), render_page('static_page.html', contact))
+        write_html('404.html', render_page('404.html', {'title': 'Page Not Found'}))
+        write_html(os.path.join('home', 'index.html'), HOME_REDIRECT_HTML)
+        write_html('sitemap.xml', engine.get_template('sitemap.xml').render(Context({'website': website_data, 'pages': pages})))
+        write_html('robots.txt', 'User-agent: *\nAllow: /\nSitemap: https://' + website_data['domain'] + '/sitemap.xml')
+        write_html('_headers', HEADERS_FILE)
+        write_html('nginx.conf', HTML_NGINX_CONF.format(domain=website_data['domain']))
+
+        for asset_dir in ('media', 'static'):
+            mirror_tree(os.path.join(self.site_dir, asset_dir), os.path.join(self.html_dir, asset_dir))
+        return {'shared': shared_hash, 'pages': rendered}
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink for ZipFile that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(site_dir):
+    """
+    Yield a ZIP archive of `site_dir` chunk by chunk. At most one chunk of file
+    data is held in memory at a time, whatever the size of the site.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, dirs, files in os.walk(site_dir):
+            dirs.sort()
+            for file in sorted(files):
+                file_path = os.path.join(root, file)
+                zinfo = zipfile.ZipInfo.from_file(file_path, os.path.relpath(file_path, site_dir))
+                if os.path.splitext(file)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dest:
+                    for chunk in iter(lambda: src.read(ZIP_CHUNK_SIZE), b''):
+                        dest.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+                data = buffer.drain()
+                if data:
+                    yield data
+    yield buffer.drain()
+
+
+def write_zip(site_dir, zip_path):
+    """Write the archive produced by iter_zip() to `zip_path`."""
+    with open(zip_path, 'wb') as f:
+        for chunk in iter_zip(site_dir):
+            f.write(chunk)
+
+
+def build_website(website, force=False, progress=None, mode='django'):
+    """
+    Incrementally build `website` and return the output directory: the Django
+    project for mode 'django', or the pre-rendered site for mode 'html'.
+    """
+    return SiteBuilder(website, progress=progress, mode=mode).build(force=force)
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Website, Page, Menu, Author
+from .models import Website, Page, Menu, Author, SlugAllocator, BUILD_MODE_CHOICES
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django.utils.text import slugify
 import re
@@ -65,13 +65,12 @@ class PageForm(forms.ModelForm):
         else:
             slug = '/'
         slug = re.sub(r'/+', '/', slug)
-        base_slug = slug
-        counter = 1
-        website = self.instance.website if self.instance.pk else self.initial.get('website')
-        if website:
-            while Page.objects.filter(website=website, slug=slug).exclude(pk=self.instance.pk).exists():
-                slug = re.sub(r'/$', '', base_slug) + f'-{counter}/'
-                counter += 1
+        website = self.initial.get('website')
+        website_id = self.instance.website_id or (website.id if website else None)
+        if website_id:
+            # Page.save allocates again from the same base, in case another page takes the slug meanwhile
+            self.instance.slug_base = slug
+            slug = SlugAllocator(website_id, exclude_pk=self.instance.pk).allocate(slug, current=self.instance.slug if self.instance.pk else None)
         return slug
 
 class GitHubRepoForm(forms.Form):
@@ -81,17 +80,31 @@ class GitHubRepoForm(forms.Form):
         label="Repo name*",
         help_text="Enter a new repository name to create a new repository"
     )
-    existing_repo = forms.ChoiceField(
-        required=False, 
+    existing_repo = forms.CharField(
+        max_length=200,
+        required=False,
         label="Existing repo",
-        help_text="Or select an existing repository from the dropdown"
+        widget=forms.TextInput(attrs={'list': 'github-repo-options', 'autocomplete': 'off', 'placeholder': 'Start typing to search your repositories'}),
+        help_text="Or search for an existing repository"
+    )
+    build_mode = forms.ChoiceField(
+        choices=BUILD_MODE_CHOICES,
+        initial='django',
+        label="Build mode",
+        help_text="Push the Django project, or pre-rendered HTML that any static host can serve"
     )
 
     def __init__(self, *args, **kwargs):
-        repos = kwargs.pop('repos', [])
+        # Known repository names, or None while the list is still being fetched
+        self.repos = kwargs.pop('repos', None)
         self.connected_repo = kwargs.pop('connected_repo', None)
         super().__init__(*args, **kwargs)
-        self.fields['existing_repo'].choices = [('', '-- Select Repository --')] + [(repo, repo) for repo in repos]
+
+    def clean_existing_repo(self):
+        existing_repo = self.cleaned_data.get('existing_repo', '').strip()
+        if existing_repo and self.repos is not None and existing_repo not in self.repos:
+            raise forms.ValidationError("No repository with this name was found on your GitHub account.")
+        return existing_repo
 
     def clean(self):
         cleaned_data = super().clean()
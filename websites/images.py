@@ -0,0 +1,214 @@
+import base64
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageFilter, ImageOps
+
+from .media import MediaCache
+
+try:
+    import pillow_avif  # noqa: F401  (registers AVIF with Pillow versions that lack it)
+except ImportError:
+    pass
+
+RESPONSIVE_FORMATS_VERSION = 1
+QUALITY = {'AVIF': 55, 'WEBP': 78, 'JPEG': 82}
+MIME_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+EXTENSIONS = {'AVIF': '.avif', 'WEBP': '.webp', 'JPEG': '.jpg', 'PNG': '.png'}
+RESIZABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+PLACEHOLDER_VERSION = 1
+PLACEHOLDER_SIZE = 16
+
+
+def modern_formats():
+    """Next-gen formats this Pillow build can encode, best first."""
+    Image.init()
+    return [fmt for fmt in ('AVIF', 'WEBP') if fmt in Image.SAVE]
+
+
+def image_dimensions(img):
+    """Display size of an opened image, read from its header (no pixel decode) and honouring EXIF rotation."""
+    width, height = img.size
+    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def has_transparency(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def placeholder_data_uri(img):
+    """A tiny blurred WebP of an opened image, as a data URI for use as a CSS background."""
+    # JPEG can decode straight to a reduced scale, which makes this cheap even for large photos
+    img.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+    small = ImageOps.exif_transpose(img).convert('RGB')
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    small = small.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    small.save(buffer, format='WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def optimize_upload(file, max_width):
+    """
+    Prepare an uploaded image for storage: apply its EXIF rotation, scale it down
+    to at most `max_width` pixels wide and re-encode it without metadata. BMPs
+    become JPEGs. Returns (bytes, extension), or None for files that should be
+    stored unchanged (animated images, formats Pillow cannot re-encode).
+    """
+    try:
+        with Image.open(file) as source:
+            fmt = source.format
+            if getattr(source, 'is_animated', False) or fmt not in ('JPEG', 'PNG', 'WEBP', 'BMP'):
+                return None
+            img = ImageOps.exif_transpose(source)
+            img.load()
+    except Exception as e:
+        print(f"Could not process upload: {e}")
+        return None
+
+    if img.width > max_width:
+        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    if fmt == 'PNG':
+        img.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue(), 'png'
+    if fmt == 'WEBP':
+        img.save(buffer, format='WEBP', quality=85, method=6)
+        return buffer.getvalue(), 'webp'
+    img.convert('RGB').save(buffer, format='JPEG', quality=85, optimize=True, progressive=True)
+    return buffer.getvalue(), 'jpg'
+
+
+class ResponsiveImages:
+    """
+    Produces resized variants of cached media files: each configured width in
+    AVIF (when Pillow can encode it) and WebP, plus a JPEG (or PNG, for images
+    with transparency) fallback. Variants live in the media cache next to their
+    source and are named after it, so they are generated once per image content.
+
+    The description of a source's variants is stored in variants/<profile><filename>.json:
+        {"key", "width", "height", "fallback", "sources": {mime: [[width, filename], ...]}}
+    """
+
+    def __init__(self, cache=None, widths=None, profile=''):
+        self.cache = cache or MediaCache()
+        self.widths = sorted(widths or getattr(settings, 'EXPORT_IMAGE_WIDTHS', (480, 960, 1600)))
+        self.formats = modern_formats()
+        # Profiles (e.g. 'hero-') keep differently sized sets of the same source apart
+        self.profile = profile
+        self.key = [RESPONSIVE_FORMATS_VERSION, self.widths, self.formats, QUALITY]
+        for sub in ('variants', 'meta'):
+            os.makedirs(os.path.join(self.cache.root, sub), exist_ok=True)
+
+    def _record_path(self, filename):
+        return os.path.join(self.cache.root, 'variants', self.profile + filename + '.json')
+
+    def _save(self, img, fmt, path):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.cache.root, 'tmp'))
+        os.close(fd)
+        options = {'quality': QUALITY.get(fmt)} if fmt in QUALITY else {'optimize': True}
+        if fmt == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif fmt == 'WEBP':
+            options['method'] = 6
+        img.save(tmp_path, format=fmt, **options)
+        os.replace(tmp_path, path)
+
+    def variants(self, filename):
+        """Return the variant record for a cached file, generating it if needed, or None if it is not a raster image."""
+        if os.path.splitext(filename)[1].lower() not in RESIZABLE_EXTENSIONS:
+            return None
+        try:
+            with open(self._record_path(filename)) as f:
+                record = json.load(f)
+            if record['key'] == self.key:
+                return record
+        except (OSError, ValueError, KeyError):
+            pass
+
+        try:
+            with Image.open(self.cache.path(filename)) as source:
+                if getattr(source, 'is_animated', False):
+                    return None
+                img = ImageOps.exif_transpose(source)
+                img.load()
+        except Exception as e:
+            print(f"Could not create variants of {filename}: {e}")
+            return None
+
+        has_alpha = has_transparency(img)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+        fallback_format = 'PNG' if has_alpha else 'JPEG'
+        width, height = img.size
+        targets = sorted({*(w for w in self.widths if w < width), min(width, self.widths[-1])})
+
+        stem = os.path.splitext(filename)[0]
+        sources = {}
+        for target in targets:
+            resized = img if target == width else img.resize((target, round(height * target / width)), Image.LANCZOS)
+            for fmt in self.formats + [fallback_format]:
+                name = f'{stem}-{self.profile}{target}w{EXTENSIONS[fmt]}'
+                self._save(resized, fmt, self.cache.path(name))
+                sources.setdefault(MIME_TYPES[fmt], []).append([target, name])
+
+        record = {
+            'key': self.key,
+            'width': width,
+            'height': height,
+            'fallback': MIME_TYPES[fallback_format],
+            'sources': sources,
+        }
+        self.cache._write_atomic(self._record_path(filename), json.dumps(record))
+        return record
+
+    def metadata(self, path, name):
+        """
+        Intrinsic size and blurred placeholder of the image at `path`, cached as
+        meta/<name>.json, so `name` must identify the file's content. Returns
+        {"width", "height", "placeholder"} (placeholder is '' for images with
+        transparency) or None if the file is not an image Pillow can read.
+        """
+        record_path = os.path.join(self.cache.root, 'meta', name + '.json')
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+            if record.get('version') == PLACEHOLDER_VERSION:
+                return record
+        except (OSError, ValueError):
+            pass
+        try:
+            with Image.open(path) as img:
+                width, height = image_dimensions(img)
+                placeholder = '' if has_transparency(img) else placeholder_data_uri(img)
+        except Exception as e:
+            print(f"Could not read image {path}: {e}")
+            return None
+        record = {'version': PLACEHOLDER_VERSION, 'width': width, 'height': height, 'placeholder': placeholder}
+        self.cache._write_atomic(record_path, json.dumps(record))
+        return record
+
+    def prepare(self, filename):
+        meta = self.metadata(self.cache.path(filename), filename)
+        if meta is None:
+            return None
+        return dict(meta, variants=self.variants(filename))
+
+    def prepare_all(self, filenames):
+        """
+        Describe and generate variants for many cached files in parallel.
+        Returns {filename: metadata() plus "variants": variants() record or None}
+        for every file that is a readable image.
+        """
+        filenames = sorted(set(filenames))
+        if not filenames:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1)) as pool:
+            records = dict(zip(filenames, pool.map(self.prepare, filenames)))
+        return {name: record for name, record in records.items() if record}
+
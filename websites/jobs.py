@@ -0,0 +1,147 @@
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .builder import build_lock, build_website, write_zip
+from .models import BuildJob
+from .publishing import publish_to_github
+
+# Running jobs that have not reported progress for this long are assumed to
+# belong to a worker that died and are put back in the queue.
+STALE_JOB_TIMEOUT = timedelta(minutes=30)
+# Seconds between heartbeats of a running job, which keep long stages from looking stale
+HEARTBEAT_INTERVAL = 60
+
+
+def artifacts_dir():
+    path = os.path.join(settings.EXPORT_CACHE_ROOT, 'artifacts')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def run_export_job(job):
+    website = job.website
+    mode = job.params.get('mode', 'django')
+    site_dir = build_website(website, progress=lambda stage, percent: job.report(stage, percent * 0.7), mode=mode)
+    job.report('Packaging archive', 75)
+    suffix = '_html' if mode == 'html' else ''
+    zip_path = os.path.join(artifacts_dir(), f'job_{job.pk}_{website.domain}{suffix}.zip')
+    with build_lock(website.id):
+        write_zip(site_dir, zip_path + '.part')
+    os.replace(zip_path + '.part', zip_path)
+    job.artifact = zip_path
+
+    # Only the newest archive of a website is kept for each build mode
+    previous = [
+        old_job for old_job in BuildJob.objects.filter(website=website, kind='export').exclude(pk=job.pk).exclude(artifact='')
+        if old_job.params.get('mode', 'django') == mode
+    ]
+    for old_job in previous:
+        try:
+            os.remove(old_job.artifact)
+        except OSError:
+            pass
+    BuildJob.objects.filter(pk__in=[old_job.pk for old_job in previous]).update(artifact='')
+    return f'Export of {website.domain} is ready.'
+
+
+def run_github_job(job):
+    full_name = publish_to_github(
+        job.website,
+        repo_name=job.params.get('repo_name'),
+        existing_repo_selected=job.params.get('existing_repo'),
+        progress=job.report,
+        mode=job.params.get('mode', 'django'),
+    )
+    return f'Website successfully pushed to {full_name}!'
+
+
+JOB_HANDLERS = {
+    'export': run_export_job,
+    'github': run_github_job,
+}
+
+
+def claim_next_job(job_id=None):
+    """
+    Atomically move the oldest queued job (or the job `job_id`, if it is still
+    queued) to 'running' and return it, or None when there is nothing to claim.
+    Safe with several workers on any database.
+    """
+    queued = BuildJob.objects.filter(status='queued')
+    if job_id is not None:
+        queued = queued.filter(pk=job_id)
+    while True:
+        job = queued.order_by('created_at').first()
+        if job is None:
+            return None
+        claimed = BuildJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=timezone.now(), stage='Starting', progress=0, updated_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale_jobs():
+    cutoff = timezone.now() - STALE_JOB_TIMEOUT
+    return BuildJob.objects.filter(status='running', updated_at__lt=cutoff).update(status='queued', stage='Requeued')
+
+
+def owned(job):
+    """The job's row, as long as it is still the run `job` was claimed for (not requeued or claimed again)."""
+    return BuildJob.objects.filter(pk=job.pk, status='running', started_at=job.started_at)
+
+
+@contextmanager
+def heartbeat(job):
+    """Touch the job's updated_at from a background thread while the body runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                owned(job).update(updated_at=timezone.now())
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Execute a claimed job and record its outcome. Returns the job as recorded:
+    the outcome is dropped if the job was requeued meanwhile, so that it cannot
+    overwrite a second run of it.
+    """
+    try:
+        with heartbeat(job):
+            job.message = JOB_HANDLERS[job.kind](job)
+        job.status = 'succeeded'
+        job.stage = 'Done'
+        job.progress = 100
+    except Exception as e:
+        traceback.print_exc()
+        job.status = 'failed'
+        job.message = f'Error during {job.get_kind_display().lower()}: {e}'
+    job.finished_at = timezone.now()
+    recorded = owned(job).update(
+        status=job.status, stage=job.stage, progress=job.progress, message=job.message,
+        artifact=job.artifact, finished_at=job.finished_at, updated_at=job.finished_at,
+    )
+    if not recorded:
+        print(f"Dropping the {job.status} outcome of job #{job.pk}: it was requeued while running")
+        return BuildJob.objects.get(pk=job.pk)
+    return job
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from websites.models import BUILD_MODE_CHOICES, BuildJob, Website
+
+
+def init_worker(tmp_root):
+    """Give each pool process its own temp directory and database connection."""
+    import django
+    django.setup()
+    tempfile.tempdir = os.path.join(tmp_root, f'worker_{os.getpid()}')
+    os.makedirs(tempfile.tempdir, exist_ok=True)
+    connections.close_all()
+
+
+def run_website(website_id, kind, mode):
+    """
+    Run one export or GitHub push as a BuildJob in a pool process. Returns its
+    outcome. Websites that already have a job of this kind queued or running
+    are skipped, so the batch never builds a site alongside run_build_worker.
+    """
+    from websites.jobs import claim_next_job, run_job
+
+    close_old_connections()
+    started = time.monotonic()
+    website = Website.objects.get(pk=website_id)
+    active = BuildJob.objects.filter(website=website, kind=kind, status__in=['queued', 'running']).first()
+    job = None
+    if active is None:
+        job, created = BuildJob.enqueue(website, kind, params={'mode': mode})
+        job = claim_next_job(job.id)
+    if job is None:
+        return {
+            'id': website_id,
+            'domain': website.domain,
+            'status': 'skipped',
+            'message': 'Another job for this website is queued or running; run the command again later.',
+            'job': active and active.pk,
+            'seconds': round(time.monotonic() - started, 2),
+        }
+    job = run_job(job)
+    return {
+        'id': website_id,
+        'domain': website.domain,
+        'status': job.status,
+        'message': job.message,
+        'job': job.pk,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Export or push many websites in parallel, e.g. after a template change.'
+
+    def add_arguments(self, parser):
+        selection = parser.add_argument_group('website selection (combined with AND)')
+        selection.add_argument('--all', action='store_true', help='Every website.')
+        selection.add_argument('--owner', action='append', default=[], help='Username or email of an owner (repeatable).')
+        selection.add_argument('--changed-since', help='Only websites whose settings, pages or menus changed since this ISO date/time.')
+        selection.add_argument('--website', type=int, action='append', default=[], help='Website id (repeatable).')
+        parser.add_argument('--kind', choices=['export', 'github'], default='export', help='Export archives (default) or push connected GitHub repositories.')
+        parser.add_argument('--mode', choices=[value for value, label in BUILD_MODE_CHOICES], default='django')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of processes (default: CPU count).')
+        parser.add_argument('--checkpoint', help='Progress file; defaults to one derived from the selection under EXPORT_CACHE_ROOT/batch/.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and process every selected website again.')
+
+    def select_websites(self, options):
+        if not (options['all'] or options['owner'] or options['changed_since'] or options['website']):
+            raise CommandError('Choose websites with --all, --owner, --changed-since and/or --website.')
+        websites = Website.objects.all()
+        if options['owner']:
+            websites = websites.filter(Q(owner__username__in=options['owner']) | Q(owner__email__in=options['owner']))
+        if options['website']:
+            websites = websites.filter(pk__in=options['website'])
+        if options['changed_since']:
+            since = parse_datetime(options['changed_since'])
+            if since is None and parse_date(options['changed_since']):
+                since = parse_datetime(options['changed_since'] + 'T00:00')
+            if since is None:
+                raise CommandError(f"Invalid --changed-since value: {options['changed_since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            websites = websites.filter(
+                Q(updated_at__gte=since) | Q(pages__updated_at__gte=since) | Q(menus__updated_at__gte=since)
+            ).distinct()
+        if options['kind'] == 'github':
+            skipped = websites.filter(github_repo__in=['', None]).count()
+            if skipped:
+                self.stdout.write(f'Skipping {skipped} website(s) without a connected GitHub repository.')
+            websites = websites.exclude(github_repo__in=['', None])
+        return list(websites.order_by('pk').values_list('pk', flat=True))
+
+    def checkpoint_path(self, options):
+        if options['checkpoint']:
+            return options['checkpoint']
+        selection = {key: options[key] for key in ('all', 'owner', 'changed_since', 'website', 'kind', 'mode')}
+        digest = hashlib.sha256(json.dumps(selection, sort_keys=True).encode()).hexdigest()[:12]
+        return os.path.join(settings.EXPORT_CACHE_ROOT, 'batch', f'{options["kind"]}_{digest}.json')
+
+    def save_checkpoint(self, path, results):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + '.part', 'w') as f:
+            json.dump(results, f, indent=2)
+        os.replace(path + '.part', path)
+
+    def handle(self, *args, **options):
+        website_ids = self.select_websites(options)
+        path = self.checkpoint_path(options)
+        results = {}
+        if os.path.exists(path) and not options['restart']:
+            with open(path) as f:
+                results = json.load(f)
+        done = {int(key) for key, result in results.items() if result['status'] == 'succeeded'}
+        pending = [website_id for website_id in website_ids if website_id not in done]
+        self.stdout.write(
+            f'{len(website_ids)} website(s) selected, {len(website_ids) - len(pending)} already done '
+            f'according to {path}, {len(pending)} to {options["kind"]}.'
+        )
+        if not pending:
+            return
+
+        started = time.monotonic()
+        tmp_root = tempfile.mkdtemp(prefix='publish_websites_')
+        # Connections must not be shared with the forked workers
+        connections.close_all()
+        try:
+            with ProcessPoolExecutor(max_workers=max(1, options['workers']), initializer=init_worker, initargs=(tmp_root,)) as pool:
+                futures = {pool.submit(run_website, website_id, options['kind'], options['mode']): website_id for website_id in pending}
+                for count, future in enumerate(as_completed(futures), 1):
+                    website_id = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'id': website_id, 'domain': '', 'status': 'failed', 'message': str(e), 'job': None, 'seconds': 0}
+                    results[str(website_id)] = result
+                    self.save_checkpoint(path, results)
+                    self.stdout.write(f'[{count}/{len(pending)}] {result["domain"] or website_id}: {result["status"]} in {result["seconds"]:.1f}s')
+        finally:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+        elapsed = time.monotonic() - started
+        ran = [results[str(website_id)] for website_id in pending]
+        self.stdout.write('\nWebsite                                  Status     Seconds')
+        for result in sorted(ran, key=lambda result: -result['seconds']):
+            self.stdout.write(f'{(result["domain"] or str(result["id"]))[:40]:<40} {result["status"]:<10} {result["seconds"]:>7.1f}')
+            if result['status'] != 'succeeded':
+                self.stdout.write(f'    {result["message"]}')
+        skipped = sum(1 for result in ran if result['status'] == 'skipped')
+        failed = sum(1 for result in ran if result['status'] not in ('succeeded', 'skipped'))
+        self.stdout.write(
+            f'\n{len(ran) - failed - skipped} succeeded, {failed} failed, {skipped} skipped in {elapsed:.1f}s '
+            f'({sum(result["seconds"] for result in ran):.1f}s of build time across {options["workers"]} worker(s)).'
+        )
+        if failed or skipped:
+            self.stdout.write(f'Run the same command again to retry the failed and skipped websites (checkpoint: {path}).')
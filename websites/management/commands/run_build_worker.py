@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from websites.jobs import claim_next_job, requeue_stale_jobs, run_job
+from websites.uploads import claim_next_upload, finish_upload, requeue_stale_uploads
+
+# Seconds between sweeps for jobs and uploads abandoned by a worker that died
+REQUEUE_INTERVAL = 60
+# Uploads run ahead of jobs, but a steady stream of them yields to one job this often
+UPLOADS_PER_JOB = 10
+
+
+class Command(BaseCommand):
+    help = 'Run queued website exports, GitHub pushes and editor uploads in the background.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the jobs currently queued, then exit.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait between polls of an empty queue.')
+
+    def requeue_stale(self):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale job(s).')
+        requeued = requeue_stale_uploads()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale upload(s).')
+
+    def handle(self, *args, **options):
+        last_requeue = None
+        uploads_in_a_row = 0
+        while True:
+            close_old_connections()
+            if last_requeue is None or time.monotonic() - last_requeue >= REQUEUE_INTERVAL:
+                self.requeue_stale()
+                last_requeue = time.monotonic()
+            # Uploads are quick and an editor is waiting on them, so they go first
+            asset = claim_next_upload() if uploads_in_a_row < UPLOADS_PER_JOB else None
+            if asset is not None:
+                uploads_in_a_row += 1
+                asset = finish_upload(asset)
+                self.stdout.write(f'Upload {asset}' + (f': {asset.message}' if asset.message else ''))
+                continue
+            # Uploads held back for a job may still be waiting, so skip the idle sleep
+            uploads_waiting = uploads_in_a_row >= UPLOADS_PER_JOB
+            uploads_in_a_row = 0
+            job = claim_next_job()
+            if job is None:
+                if uploads_waiting:
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            self.stdout.write(f'Running {job}')
+            started = time.monotonic()
+            job = run_job(job)
+            self.stdout.write(f'{job} finished in {time.monotonic() - started:.1f}s: {job.message}')
@@ -0,0 +1,425 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .models import STAGED_UPLOAD_URL
+
+FETCH_TIMEOUT = 10
+DEFAULT_SIZES = '(max-width: 800px) 100vw, 800px'
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Return a process-wide requests session with a keep-alive connection pool,
+    shared by every export so repeated downloads from the same CDN reuse sockets.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = getattr(settings, 'EXPORT_FETCH_WORKERS', 16)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=1)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def is_image_tag(tag):
+    return tag.name == 'img' or (tag.name == 'input' and tag.get('type') == 'image')
+
+
+def image_name_parts(src):
+    """Return the cleaned original name and extension of a remote image url."""
+    ext = os.path.splitext(src.split('?')[0])[1]
+    if not ext or len(ext) > 6:
+        ext = '.jpg'
+
+    # Extract and decode filename
+    raw_filename = os.path.splitext(os.path.basename(src.split('?')[0]))[0]
+    decoded_filename = unquote(raw_filename)  # Decode %28 to (
+
+    # Remove any nested metadata (e.g., keep only the original filename in parentheses)
+    match = re.search(r'\(([^)]+)\)', decoded_filename)
+    if match:
+        orig_name_clean = match.group(1)
+    else:
+        # Fallback: clean hash suffix
+        orig_name_clean = re.sub(r'_[a-f0-9]{32}$', '', decoded_filename)
+
+    return orig_name_clean, ext.lower()
+
+
+class MediaCache:
+    """
+    Persistent, content-addressed store for remote media shared by all exports.
+
+    Layout under EXPORT_CACHE_ROOT/media:
+        urls/<sha1 of url>.json   -> {"url", "sha256", "filename"}
+        hashes/<sha256>           -> canonical filename for those bytes
+        files/<filename>          -> the bytes themselves
+
+    Remote urls are treated as immutable (Cloudinary urls are versioned), so a
+    url that has been fetched once is never requested again. Identical bytes
+    always resolve to the first filename they were stored under, which keeps
+    exported filenames stable across builds and lets browsers and CDNs keep
+    their caches between deploys.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(settings.EXPORT_CACHE_ROOT, 'media')
+        for sub in ('urls', 'hashes', 'files', 'tmp'):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+
+    def _url_record(self, url):
+        return os.path.join(self.root, 'urls', hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def path(self, filename):
+        return os.path.join(self.root, 'files', filename)
+
+    def lookup(self, url):
+        """Return the cached filename for `url`, or None on a cache miss."""
+        try:
+            with open(self._url_record(url)) as f:
+                filename = json.load(f)['filename']
+        except (OSError, ValueError, KeyError):
+            return None
+        return filename if os.path.exists(self.path(filename)) else None
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def store(self, url, tmp_path, digest, name, ext):
+        """Move a downloaded file into the cache and return its canonical filename. `url` may be None for local files."""
+        hash_record = os.path.join(self.root, 'hashes', digest)
+        try:
+            with open(hash_record) as f:
+                filename = f.read().strip()
+        except OSError:
+            filename = f'({name})_{digest[:16]}{ext}'
+        if os.path.exists(self.path(filename)):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, self.path(filename))
+        self._write_atomic(hash_record, filename)
+        if url:
+            self._write_atomic(self._url_record(url), json.dumps({'url': url, 'sha256': digest, 'filename': filename}))
+        return filename
+
+    def add_file(self, path, name):
+        """Copy a local file into the cache and return its canonical filename."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        os.close(fd)
+        shutil.copyfile(path, tmp_path)
+        digest = hashlib.sha256()
+        with open(tmp_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        ext = os.path.splitext(path)[1].lower() or '.jpg'
+        return self.store(None, tmp_path, digest.hexdigest(), name, ext)
+
+    def download(self, session, url):
+        """Fetch `url` into the cache unless it is already there. Returns the filename or None."""
+        filename = self.lookup(url)
+        if filename:
+            return filename
+        name, ext = image_name_parts(url)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        digest = hashlib.sha256()
+        try:
+            with session.get(url, stream=True, timeout=FETCH_TIMEOUT) as response:
+                if response.status_code != 200:
+                    os.close(fd)
+                    os.remove(tmp_path)
+                    return None
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(64 * 1024):
+                        digest.update(chunk)
+                        f.write(chunk)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self.store(url, tmp_path, digest.hexdigest(), name, ext)
+
+    def materialize(self, filename, dest_path, link=True):
+        """
+        Place a cached file at `dest_path`. Hard-links when allowed, so callers
+        that intend to modify the file in place must pass link=False.
+        """
+        if os.path.exists(dest_path):
+            return dest_path
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        try:
+            if not link:
+                raise OSError
+            os.link(self.path(filename), dest_path)
+        except OSError:
+            shutil.copyfile(self.path(filename), dest_path)
+        return dest_path
+
+
+def fetch_cached_file(url, dest_path):
+    """Download `url` through the media cache to `dest_path`. Returns dest_path or None."""
+    cache = MediaCache()
+    try:
+        filename = cache.download(get_http_session(), url)
+    except Exception as e:
+        print(f"Failed to download {url}: {e}")
+        return None
+    if not filename:
+        return None
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    return cache.materialize(filename, dest_path, link=False)
+
+
+def cache_field_file(field, name, cache=None):
+    """
+    Put the file behind a FileField into the media cache, from local storage or
+    by downloading its url. Returns the cache filename, or None if unavailable.
+    """
+    cache = cache or MediaCache()
+    try:
+        path = field.path
+    except Exception:
+        path = None
+    try:
+        if path and os.path.exists(path):
+            return cache.add_file(path, name)
+        if not path:
+            return cache.download(get_http_session(), field.url)
+    except Exception as e:
+        print(f"Failed to cache {field}: {e}")
+    return None
+
+
+class ImageFetcher:
+    """
+    Downloads a batch of remote images concurrently into the media cache on the
+    shared session, allowing at most `per_host` requests in flight against any
+    single host. Images already in the media cache need no request.
+    """
+
+    def __init__(self, max_workers=None, per_host=None, cache=None):
+        self.max_workers = max_workers or getattr(settings, 'EXPORT_FETCH_WORKERS', 16)
+        self.per_host = per_host or getattr(settings, 'EXPORT_FETCH_PER_HOST', 6)
+        self.session = get_http_session()
+        self.cache = cache or MediaCache()
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _fetch(self, url):
+        try:
+            with self._host_limit(url):
+                filename = self.cache.download(self.session, url)
+        except Exception as e:
+            print(f"Failed to download image {url}: {e}")
+            return None
+        return filename
+
+    def fetch_all(self, urls):
+        """
+        Fetch every url in `urls` and return a dict mapping each successfully
+        fetched url to its media cache filename, which is also the name it is
+        exported under in media/websites/.
+        """
+        downloaded = {}
+        missing = []
+        for url in urls:
+            filename = self.cache.lookup(url)
+            if filename:
+                downloaded[url] = filename
+            else:
+                missing.append(url)
+        if missing:
+            workers = min(self.max_workers, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for url, filename in zip(missing, pool.map(self._fetch, missing)):
+                    if filename:
+                        downloaded[url] = filename
+        return downloaded
+
+
+def media_url(name, prefix='/media/websites/'):
+    """
+    URL of an exported media file. Cached names keep the original file name,
+    spaces and commas included, so they are quoted; an unquoted comma would
+    split a srcset candidate in two.
+    """
+    return prefix + quote(name)
+
+
+def variant_files(record):
+    return [name for candidates in record['sources'].values() for _, name in candidates]
+
+
+def image_sizes(tag):
+    """The `sizes` hint for an image: its fixed CSS/attribute width when it has one, else the content column."""
+    match = re.search(r'(?:^|;)\s*width\s*:\s*(\d+)px', tag.get('style', ''))
+    if match:
+        return f'{match.group(1)}px'
+    if str(tag.get('width', '')).isdigit():
+        return f"{tag['width']}px"
+    return DEFAULT_SIZES
+
+
+def picture_tag(soup, img, record, url_prefix):
+    """Wrap `img` in a <picture> offering every variant in `record`. Returns the <picture> tag."""
+    def srcset(candidates):
+        return ', '.join(f'{media_url(name, url_prefix)} {width}w' for width, name in candidates)
+
+    sizes = image_sizes(img)
+    picture = soup.new_tag('picture')
+    for mime, candidates in record['sources'].items():
+        if mime == record['fallback']:
+            continue
+        picture.append(soup.new_tag('source', attrs={'type': mime, 'srcset': srcset(candidates), 'sizes': sizes}))
+    fallback = record['sources'][record['fallback']]
+    img['src'] = media_url(fallback[-1][1], url_prefix)
+    img['srcset'] = srcset(fallback)
+    img['sizes'] = sizes
+    img.replace_with(picture)
+    picture.append(img)
+    return picture
+
+
+def apply_intrinsic_size(img, info):
+    """
+    Give `img` width/height attributes matching the image's aspect ratio, so the
+    browser reserves its box before it loads, and a blurred placeholder background.
+    """
+    width, height = info['width'], info['height']
+    given_width, given_height = str(img.get('width', '')), str(img.get('height', ''))
+    if given_width.isdigit() and not given_height.isdigit():
+        img['height'] = str(round(int(given_width) * height / width))
+    elif given_height.isdigit() and not given_width.isdigit():
+        img['width'] = str(round(int(given_height) * width / height))
+    elif not given_width.isdigit() and not given_height.isdigit():
+        img['width'] = str(width)
+        img['height'] = str(height)
+    if info.get('placeholder'):
+        style = img.get('style', '').strip()
+        if style and not style.endswith(';'):
+            style += ';'
+        img['style'] = style + f"background-image:url({info['placeholder']});background-size:cover"
+
+
+def rewrite_images(soup, downloaded, images=None):
+    """
+    Point image tags at their local copies and turn <input type="image"> into <img>.
+    Images described by images.ResponsiveImages.prepare_all get their intrinsic
+    size and a placeholder, and those with responsive variants become a
+    <picture> offering them. Returns the rewritten HTML and the list of local
+    filenames it references.
+    """
+    images = images or {}
+    used = []
+    for tag in soup.find_all(src=True):
+        src = tag.get('src')
+        if not is_image_tag(tag):
+            continue
+        if src in downloaded:
+            # Update the tag's src to local media path
+            tag['src'] = media_url(downloaded[src])
+            used.append(downloaded[src])
+
+        # Convert <input type="image"> to <img>
+        if tag.name == 'input':
+            new_img = soup.new_tag('img')
+            # Copy src, alt, style, width, height, class, id
+            for attr in ['src', 'alt', 'style', 'width', 'height', 'class', 'id']:
+                if tag.has_attr(attr):
+                    new_img[attr] = tag[attr]
+            tag.replace_with(new_img)
+            tag = new_img
+
+        info = images.get(downloaded.get(src))
+        if not info:
+            continue
+        record = info['variants']
+        if record and tag.parent is not None and tag.parent.name != 'picture':
+            # The variants replace the original file, which is no longer referenced
+            picture_tag(soup, tag, record, '/media/websites/')
+            used.remove(downloaded[src])
+            used.extend(variant_files(record))
+        # After picture_tag, which derives `sizes` from any width the editor set
+        apply_intrinsic_size(tag, info)
+    return str(soup), used
+
+
+def staged_upload_file(src):
+    """Local path of an editor upload the worker has not stored yet, or None."""
+    path = urlsplit(src).path
+    if not path.startswith(STAGED_UPLOAD_URL):
+        return None
+    path = os.path.join(settings.UPLOAD_STAGING_ROOT, os.path.basename(unquote(path)))
+    return path if os.path.isfile(path) else None
+
+
+def download_and_rewrite_pages(pages, media_dir, responsive=None):
+    """
+    Download the remote images of all `pages` concurrently, then rewrite each
+    page's HTML in a single pass. When `responsive` (an images.ResponsiveImages)
+    is given, downloaded images also get their intrinsic size, a placeholder
+    and resized variants. Returns a
+    dict of page id -> {'content': rewritten HTML, 'media': [local filenames],
+    'complete': False if any of the page's images could not be fetched}.
+    """
+    soups = {}
+    urls = {}
+    page_urls = {}
+    for page in pages:
+        soup = BeautifulSoup(page.content, 'html.parser')
+        soups[page.id] = soup
+        page_urls[page.id] = set()
+        for tag in soup.find_all(src=True):
+            src = tag.get('src')
+            if src and is_image_tag(tag) and (src.startswith('http') or src.startswith(STAGED_UPLOAD_URL)):
+                urls[src] = None
+                page_urls[page.id].add(src)
+
+    fetcher = ImageFetcher()
+    # Uploads still waiting for the worker are taken from the staging directory
+    staged = {src: staged_upload_file(src) for src in urls if src.startswith(STAGED_UPLOAD_URL)}
+    downloaded = fetcher.fetch_all([src for src in urls if src not in staged])
+    for src, path in staged.items():
+        if path:
+            downloaded[src] = fetcher.cache.add_file(path, image_name_parts(src)[0])
+    images = responsive.prepare_all(downloaded.values()) if responsive else {}
+    rewritten = {}
+    for page_id, soup in soups.items():
+        content, media = rewrite_images(soup, downloaded, images)
+        rewritten[page_id] = {
+            'content': content,
+            'media': sorted(set(media)),
+            'complete': all(src in downloaded for src in page_urls[page_id]),
+        }
+        # Only files a page actually references are placed in the export
+        for name in rewritten[page_id]['media']:
+            fetcher.cache.materialize(name, os.path.join(media_dir, 'websites', name))
+    return rewritten
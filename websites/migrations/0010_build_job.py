@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-17 23:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0009_author_model'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuildJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('export', 'Export'), ('github', 'GitHub Push')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('stage', models.CharField(blank=True, max_length=100)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Percent complete (0-100)')),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('message', models.TextField(blank=True)),
+                ('artifact', models.CharField(blank=True, help_text='Path of the finished archive, for export jobs', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('website', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='build_jobs', to='websites.website')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='websites_bu_status_9b234e_idx'), models.Index(fields=['website', 'kind', 'status'], name='websites_bu_website_f656a8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0010_build_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadedAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('public_id', models.CharField(max_length=255)),
+                ('file_name', models.CharField(max_length=255, unique=True)),
+                ('url', models.CharField(blank=True, help_text='Final URL, once the upload is stored', max_length=500)),
+                ('status', models.CharField(choices=[('staged', 'Staged'), ('uploading', 'Uploading'), ('uploaded', 'Uploaded'), ('failed', 'Failed')], default='staged', max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('website', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='uploads', to='websites.website')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='websites_up_status_cb56c5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0011_uploaded_asset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedasset',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the file as uploaded, for deduplication', max_length=64),
+        ),
+    ]
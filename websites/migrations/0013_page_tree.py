@@ -0,0 +1,58 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_page_tree(apps, schema_editor):
+    """Fill in path, depth, parent and breadcrumb for existing pages, one website at a time."""
+    Page = apps.get_model('websites', 'Page')
+    website_ids = Page.objects.values_list('website_id', flat=True).distinct()
+    for website_id in website_ids:
+        pages = list(Page.objects.filter(website_id=website_id))
+        ids = {}
+        for page in pages:
+            page.path = '/'.join(part for part in (page.slug or '').split('/') if part)
+            page.depth = page.path.count('/') if page.path else 0
+            ids[page.path] = page.id
+        for page in pages:
+            parts = page.path.split('/') if page.path else []
+            breadcrumb = [{'title': 'Domain', 'url': '/', 'exists': True}]
+            page.parent_id = None
+            for i, part in enumerate(parts, 1):
+                current = '/'.join(parts[:i])
+                if i < len(parts) and current in ids:
+                    page.parent_id = ids[current]
+                breadcrumb.append({'title': part.capitalize(), 'url': f"/{current}/", 'exists': current in ids})
+            page.breadcrumb = breadcrumb
+        Page.objects.bulk_update(pages, ['path', 'depth', 'parent', 'breadcrumb'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0012_uploaded_asset_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='parent',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='websites.page'),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['website', 'path'], name='websites_pa_website_3c8a90_idx'),
+        ),
+        migrations.RunPython(build_page_tree, migrations.RunPython.noop),
+    ]
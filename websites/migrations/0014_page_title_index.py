@@ -0,0 +1,17 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0013_page_tree'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['website', 'title'], name='websites_pa_website_af8f82_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.2 on 2026-10-18 00:19
+
+from django.db import migrations, models
+
+
+def fill_title_keys(apps, schema_editor):
+    Page = apps.get_model('websites', 'Page')
+    pages = list(Page.objects.only('id', 'title'))
+    for page in pages:
+        page.title_key = page.title.lower()
+    Page.objects.bulk_update(pages, ['title_key'], batch_size=500)
+
+
+def analyze_pages(apps, schema_editor):
+    # Without statistics SQLite's planner prefers the plain website index over
+    # the title_key/path range indexes for the page search; PostgreSQL gathers them itself
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('ANALYZE websites_page')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websites', '0014_page_title_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='page',
+            name='websites_pa_website_af8f82_idx',
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='title_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(fill_title_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['website', 'title_key'], name='websites_pa_website_4ec5f4_idx'),
+        ),
+        migrations.RunPython(analyze_pages, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+import re
+import time
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils.text import slugify
+from django.utils import timezone
+from django.db.models import Max
+from django.core.cache import caches
 from ckeditor.fields import RichTextField
 
 MENU_TYPE_CHOICES = [
@@ -8,6 +14,33 @@ MENU_TYPE_CHOICES = [
     ('footer', 'Footer Menu'),
 ]
 
+BUILD_JOB_KIND_CHOICES = [
+    ('export', 'Export'),
+    ('github', 'GitHub Push'),
+]
+
+BUILD_JOB_STATUS_CHOICES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+]
+
+UPLOAD_STATUS_CHOICES = [
+    ('staged', 'Staged'),
+    ('uploading', 'Uploading'),
+    ('uploaded', 'Uploaded'),
+    ('failed', 'Failed'),
+]
+
+# Editor uploads are served from here until the worker has stored them for good
+STAGED_UPLOAD_URL = '/uploads/staged/'
+
+BUILD_MODE_CHOICES = [
+    ('django', 'Django project'),
+    ('html', 'Static HTML'),
+]
+
 class Author(models.Model):
     name = models.CharField(max_length=100)
     logo = models.ImageField(upload_to='authors/', blank=True, null=True)
@@ -64,6 +97,79 @@ class Website(models.Model):
             self.domain = slugify(self.name)
         super().save(*args, **kwargs)
 
+def page_path(slug):
+    """Normalised tree path of a slug: '/services/roofing/' -> 'services/roofing'."""
+    return '/'.join(part for part in (slug or '').split('/') if part)
+
+
+def ancestor_paths(path):
+    """Paths of every ancestor of a tree path, outermost first: 'a/b/c' -> ['a', 'a/b']."""
+    parts = path.split('/') if path else []
+    return ['/'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+def build_breadcrumb(path, existing_paths):
+    """Breadcrumb of the page at `path`, given the set of ancestor paths that are pages."""
+    breadcrumbs = [{'title': 'Domain', 'url': '/', 'exists': True}]
+    parts = path.split('/') if path else []
+    for i, part in enumerate(parts, 1):
+        current = '/'.join(parts[:i])
+        breadcrumbs.append({
+            'title': part.capitalize(),
+            'url': f"/{current}/",
+            'exists': i == len(parts) or current in existing_paths
+        })
+    return breadcrumbs
+
+
+SLUG_ALLOCATION_ATTEMPTS = 5
+
+
+class SlugAllocator:
+    """
+    Finds free page slugs within one website: a taken slug gets the next free
+    `-N` suffix (`roofing` -> `roofing-3` when `roofing-2` is the highest).
+    Each allocate() is one indexed prefix query; with `preload` the website's
+    slugs are read once and allocations are tracked in memory, for batch renames.
+    """
+
+    def __init__(self, website_id, exclude_pk=None, preload=False):
+        self.website_id = website_id
+        self.exclude_pk = exclude_pk
+        self.taken = None
+        if preload:
+            self.taken = set(self.pages().values_list('slug', flat=True))
+
+    def pages(self):
+        pages = Page.objects.filter(website_id=self.website_id)
+        return pages.exclude(pk=self.exclude_pk) if self.exclude_pk else pages
+
+    def allocate(self, base_slug, current=None):
+        """
+        Return `base_slug` if it is free, else `<base>-N` with N one past the
+        highest suffix in use. A page's `current` slug is kept when it already
+        is a free `<base>-N`, so re-saving a page does not renumber it.
+        """
+        stem = base_slug.rstrip('/') or 'page'
+        if self.taken is None:
+            # A range rather than startswith, whose LIKE the (website, slug) index cannot serve;
+            # '.' is the character after '-', so the range holds exactly the slugs starting '<stem>-'
+            taken = set(self.pages().filter(
+                models.Q(slug=base_slug) | models.Q(slug__gte=f'{stem}-', slug__lt=f'{stem}.')
+            ).values_list('slug', flat=True))
+        else:
+            taken = self.taken
+        slug = base_slug
+        if slug in taken and current and current not in taken and re.fullmatch(re.escape(stem) + r'-\d+', current):
+            slug = current
+        elif slug in taken:
+            suffixes = [other[len(stem) + 1:] for other in taken if other.startswith(f'{stem}-')]
+            slug = f'{stem}-{max((int(n) for n in suffixes if n.isdigit()), default=0) + 1}'
+        if self.taken is not None:
+            self.taken.add(slug)
+        return slug
+
+
 class Page(models.Model):
     website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='pages')
     title = models.CharField(max_length=100)
@@ -77,40 +183,116 @@ class Page(models.Model):
     date_published = models.DateTimeField(null=True, blank=True, help_text='Date when the page was published')
     date_modified = models.DateTimeField(null=True, blank=True, help_text='Date when the page was last modified')
     breadcrumb = models.JSONField(editable=False, null=True, blank=True)  # auto-generated, not user-editable
+    # Tree of nested slugs, maintained on save/delete: `path` is the slug without
+    # surrounding slashes and `parent` the nearest ancestor path that is a page
+    path = models.CharField(max_length=100, editable=False, default='')
+    parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='children')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
+    # Lowercased title, so title searches can be prefix ranges over an index
+    title_key = models.CharField(max_length=100, editable=False, default='')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Read without triggering a query when a field is deferred (e.g. by .only())
+        self._saved_path = self.__dict__.get('path') if self.pk else None
+        self._saved_slug = self.__dict__.get('slug') if self.pk else None
+        self._saved_nofollow = self.__dict__.get('nofollow_document')
+        self.slug_base = None
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            while Page.objects.filter(website=self.website, slug=slug).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
-        # Auto-generate breadcrumb
-        self.breadcrumb = self.generate_breadcrumb()
+        # A slug is allocated from `slug_base` (set by PageForm) or the title;
+        # the database's unique index settles races with concurrent creates
+        base_slug = self.slug_base or (None if self.slug else slugify(self.title) or 'page')
+        if base_slug is None:
+            return self._save_in_tree(*args, **kwargs)
+        for attempt in range(SLUG_ALLOCATION_ATTEMPTS):
+            self.slug = SlugAllocator(self.website_id, exclude_pk=self.pk).allocate(base_slug, current=self._saved_slug)
+            try:
+                with transaction.atomic():
+                    return self._save_in_tree(*args, **kwargs)
+            except IntegrityError:
+                if attempt == SLUG_ALLOCATION_ATTEMPTS - 1:
+                    raise
+
+    def _save_in_tree(self, *args, **kwargs):
+        if STAGED_UPLOAD_URL in (self.content or ''):
+            self.content = UploadedAsset.resolve_staged_urls(self.content)
+        self.title_key = self.title.lower()
+        # Place the page in the tree and auto-generate its breadcrumb
+        self.path = page_path(self.slug)
+        self.depth = self.path.count('/') if self.path else 0
+        ancestors = self.ancestor_ids()
+        self.parent_id = None
+        for path in reversed(ancestor_paths(self.path)):
+            if path in ancestors:
+                self.parent_id = ancestors[path]
+                break
+        self.breadcrumb = build_breadcrumb(self.path, ancestors)
         super().save(*args, **kwargs)
+        self._saved_slug = self.slug
+        if self._saved_path != self.path:
+            # A new or moved page changes its old and new descendants' parents and breadcrumbs
+            Page.refresh_descendants(self.website_id, {self.path, self._saved_path})
+            self._saved_path = self.path
+
+    def delete(self, *args, **kwargs):
+        website_id, path = self.website_id, self.path
+        result = super().delete(*args, **kwargs)
+        Page.refresh_descendants(website_id, {path})
+        return result
+
+    def ancestor_ids(self):
+        """{path: page id} of the ancestors of this page that exist, in one query."""
+        paths = ancestor_paths(self.path)
+        if not paths:
+            return {}
+        return dict(Page.objects.filter(website_id=self.website_id, path__in=paths).values_list('path', 'id'))
 
     def generate_breadcrumb(self):
         # Returns a list of dicts: [{title, url, exists}]
-        parts = self.slug.strip('/').split('/') if self.slug else []
-        breadcrumbs = [{'title': 'Domain', 'url': '/', 'exists': True}]
-        current_slug = ''
-        for part in parts:
-            current_slug = f"{current_slug}/{part}" if current_slug else part
-            exists = Page.objects.filter(website=self.website, slug=current_slug).exists()
-            breadcrumbs.append({
-                'title': part.capitalize(),
-                'url': f"/{current_slug}/",
-                'exists': exists
-            })
-        return breadcrumbs
+        return build_breadcrumb(self.path, self.ancestor_ids())
+
+    @classmethod
+    def refresh_descendants(cls, website_id, paths):
+        """
+        Recompute the parent and breadcrumb of every page below any of
+        `paths` with one read and one bulk update. Returns the number of pages updated.
+        """
+        prefixes = models.Q()
+        for path in paths:
+            if path:
+                # The paths below `path`, as a range the (website, path) index can serve ('0' follows '/')
+                prefixes |= models.Q(path__gte=path + '/', path__lt=path + '0')
+        if not prefixes:
+            return 0
+        descendants = list(cls.objects.filter(website_id=website_id).filter(prefixes).only('id', 'path', 'parent', 'breadcrumb'))
+        if not descendants:
+            return 0
+        wanted = set()
+        for page in descendants:
+            wanted.update(ancestor_paths(page.path))
+        existing = dict(cls.objects.filter(website_id=website_id, path__in=wanted).values_list('path', 'id'))
+        now = timezone.now()
+        for page in descendants:
+            page.parent_id = None
+            for path in reversed(ancestor_paths(page.path)):
+                if path in existing:
+                    page.parent_id = existing[path]
+                    break
+            page.breadcrumb = build_breadcrumb(page.path, existing)
+            page.updated_at = now
+        cls.objects.bulk_update(descendants, ['parent', 'breadcrumb', 'updated_at'], batch_size=500)
+        return len(descendants)
 
     class Meta:
         unique_together = ('website', 'slug')
+        indexes = [
+            models.Index(fields=['website', 'path']),
+            models.Index(fields=['website', 'title_key']),
+        ]
 
 class Menu(models.Model):
     website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='menus')
@@ -124,3 +306,151 @@ class Menu(models.Model):
     def __str__(self):
         return f"{self.website.name} - {self.get_type_display()}"
 
+class BuildJob(models.Model):
+    """
+    A queued export or GitHub push, executed by `manage.py run_build_worker`.
+    Views enqueue jobs and return immediately; the browser polls the job's
+    JSON status and downloads the finished artifact later.
+    """
+    website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='build_jobs')
+    kind = models.CharField(max_length=20, choices=BUILD_JOB_KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=BUILD_JOB_STATUS_CHOICES, default='queued')
+    stage = models.CharField(max_length=100, blank=True)
+    progress = models.PositiveSmallIntegerField(default=0, help_text='Percent complete (0-100)')
+    params = models.JSONField(default=dict, blank=True)
+    message = models.TextField(blank=True)
+    artifact = models.CharField(max_length=255, blank=True, help_text='Path of the finished archive, for export jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['website', 'kind', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.website.name} - {self.get_kind_display()} #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    @classmethod
+    def enqueue(cls, website, kind, params=None, user=None):
+        """
+        Queue a job, coalescing with an equivalent one that is already pending.
+        A queued job with the same website, kind and build mode absorbs the
+        request (taking the newest params); a running job with the same params
+        absorbs it as long as nothing on the website changed since that job started.
+        Returns (job, created).
+        """
+        params = params or {}
+        active = cls.objects.filter(website=website, kind=kind, status__in=['queued', 'running']).order_by('-created_at')
+        for job in active:
+            if job.status == 'queued':
+                if job.params.get('mode') != params.get('mode'):
+                    continue
+                if job.params != params:
+                    job.params = params
+                    job.save(update_fields=['params', 'updated_at'])
+                return job, False
+            if job.params == params and not website_changed_since(website, job.started_at):
+                return job, False
+        return cls.objects.create(website=website, kind=kind, params=params, requested_by=user), True
+
+    def report(self, stage, progress):
+        """
+        Record per-stage progress without touching the other columns. Also
+        refreshes updated_at, unless the job has since been requeued.
+        """
+        self.stage = stage
+        self.progress = max(0, min(100, int(progress)))
+        BuildJob.objects.filter(pk=self.pk, status='running', started_at=self.started_at).update(
+            stage=self.stage, progress=self.progress, updated_at=timezone.now()
+        )
+
+class UploadedAsset(models.Model):
+    """
+    An image uploaded through the editor. The processed file is staged on local
+    disk and served from `staged_url` at once; `manage.py run_build_worker`
+    stores it on Cloudinary and swaps the final `url` into the pages using it.
+    Uploads of identical files reuse the first asset.
+    """
+    website = models.ForeignKey(Website, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    public_id = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, help_text='Hash of the file as uploaded, for deduplication')
+    url = models.CharField(max_length=500, blank=True, help_text='Final URL, once the upload is stored')
+    status = models.CharField(max_length=20, choices=UPLOAD_STATUS_CHOICES, default='staged')
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+    @property
+    def staged_url(self):
+        return f"{STAGED_UPLOAD_URL}{self.file_name}"
+
+    @property
+    def current_url(self):
+        return self.url if self.status == 'uploaded' else self.staged_url
+
+    @classmethod
+    def resolve_staged_urls(cls, content):
+        """Replace the staged URLs in `content` whose uploads have finished with their final URLs."""
+        names = set(re.findall(re.escape(STAGED_UPLOAD_URL) + r'([^"\'\s?#<>]+)', content))
+        for asset in cls.objects.filter(file_name__in=names, status='uploaded'):
+            content = content.replace(asset.staged_url, asset.url)
+        return content
+
+
+def website_changed_since(website, moment):
+    """True if the website, its pages or its menus were modified after `moment`."""
+    if moment is None:
+        return True
+    website.refresh_from_db(fields=['updated_at'])
+    latest = [website.updated_at]
+    latest.append(website.pages.aggregate(latest=Max('updated_at'))['latest'])
+    latest.append(website.menus.aggregate(latest=Max('updated_at'))['latest'])
+    return any(value and value > moment for value in latest)
+
+
+def nofollow_urls(website_id):
+    """
+    The set of URLs ('/<slug>') of a website's nofollow pages, as a frozenset.
+    Cached under a version stamp that Page save/delete signals replace (see
+    signals.py), so one query per change serves every editor view and export.
+    """
+    cache = caches['shared']
+    version = cache.get(f'nofollow-version:{website_id}')
+    if version is None:
+        version = invalidate_nofollow_urls(website_id)
+    key = f'nofollow:{website_id}:{version}'
+    urls = cache.get(key)
+    if urls is None:
+        slugs = Page.objects.filter(website_id=website_id, nofollow_document=True).values_list('slug', flat=True)
+        urls = frozenset(f'/{slug}' for slug in slugs)
+        cache.set(key, urls, None)
+    return urls
+
+
+def invalidate_nofollow_urls(website_id):
+    """Start a new version of a website's nofollow set and drop the old one. Returns the version."""
+    cache = caches['shared']
+    previous = cache.get(f'nofollow-version:{website_id}')
+    version = time.time_ns()
+    cache.set(f'nofollow-version:{website_id}', version, None)
+    if previous is not None:
+        cache.delete(f'nofollow:{website_id}:{previous}')
+    return version
@@ -0,0 +1,310 @@
+import base64
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import git
+from django.conf import settings
+from django.core.cache import caches
+from github import Github, GithubException, InputGitTreeElement
+
+from .builder import build_lock, build_root, build_website, mirror_tree
+
+PUBLISH_BRANCH = 'main'
+BLOB_UPLOAD_WORKERS = 8
+# Stale repository lists are still served (while a refresh runs) for this long
+REPO_LIST_MAX_AGE = 7 * 24 * 3600
+
+_repo_refreshes = set()
+_repo_refreshes_lock = threading.Lock()
+
+
+def resolve_github_repo(website, repo_name=None, existing_repo_selected=None):
+    """Return the PyGithub repository a website should be pushed to, creating it if needed."""
+    g = Github(settings.GITHUB_TOKEN)
+    user = g.get_user()
+    # If no repo_name and a connected repo exists, push to the connected repo
+    if not repo_name and website.github_repo:
+        # Extract owner and repo name from the connected repo URL
+        # Example: https://github.com/owner/repo.git
+        m = re.match(r'https://github.com/([^/]+)/([^/.]+)', website.github_repo)
+        if m:
+            owner, repo_name_from_url = m.group(1), m.group(2)
+            repo = g.get_repo(f"{owner}/{repo_name_from_url}")
+            print(f"Pushing to already connected repo: {repo.full_name}")
+        else:
+            raise Exception("Could not parse connected repo URL.")
+    elif existing_repo_selected:
+        repo = user.get_repo(repo_name)
+        print(f"Using existing repo: {repo.name}")
+    else:
+        # Create new repository (default to private)
+        try:
+            repo = user.get_repo(repo_name)
+            print(f"Repository {repo_name} already exists, using it")
+        except Exception:
+            repo = user.create_repo(repo_name, private=True)  # Default to private
+            print(f"Created new repo: {repo.name}, is_public: {not repo.private}")
+    return user, repo
+
+
+def repo_list_cache_key(token):
+    return 'github-repos:' + hashlib.sha256((token or '').encode()).hexdigest()[:16]
+
+
+def fetch_repo_names(token):
+    """Names of every repository the token's user can access (walks all result pages)."""
+    return [repo.name for repo in Github(token, per_page=100).get_user().get_repos()]
+
+
+def _refresh_repo_list(token):
+    key = repo_list_cache_key(token)
+    try:
+        names = fetch_repo_names(token)
+        caches['shared'].set(key, {'repos': names, 'fetched_at': time.time()}, REPO_LIST_MAX_AGE)
+    except Exception as e:
+        print(f"Error fetching GitHub repos: {e}")
+    finally:
+        with _repo_refreshes_lock:
+            _repo_refreshes.discard(key)
+
+
+def cached_repo_names(token, refresh=False):
+    """
+    Return (repository names or None, loading) for `token` without waiting on
+    GitHub. The list is cached per token; when it is missing, older than
+    GITHUB_REPO_CACHE_TTL seconds or `refresh` is set, it is fetched again in a
+    background thread while the cached copy (if any) keeps being served.
+    """
+    key = repo_list_cache_key(token)
+    entry = caches['shared'].get(key)
+    ttl = getattr(settings, 'GITHUB_REPO_CACHE_TTL', 600)
+    stale = entry is None or refresh or time.time() - entry['fetched_at'] > ttl
+    with _repo_refreshes_lock:
+        loading = key in _repo_refreshes
+        if stale and not loading:
+            _repo_refreshes.add(key)
+            threading.Thread(target=_refresh_repo_list, args=(token,), daemon=True).start()
+            loading = True
+    return (entry['repos'] if entry else None), loading
+
+
+def git_mirror_dir(website_id):
+    return os.path.join(build_root(website_id), 'repo')
+
+
+def open_git_mirror(website, clone_url):
+    """
+    Return the persistent working clone a website is published from, creating
+    it on first use or when the website is pushed to a different repository.
+    """
+    path = git_mirror_dir(website.id)
+    if os.path.isdir(os.path.join(path, '.git')):
+        git_repo = git.Repo(path)
+        # origin only records which repository the mirror tracks; pushes use an authenticated url
+        if 'origin' in git_repo.remotes and git_repo.remotes.origin.url == clone_url:
+            return git_repo
+        git_repo.close()
+        shutil.rmtree(path)
+    git_repo = git.Repo.init(path)
+    git_repo.create_remote('origin', clone_url)
+    return git_repo
+
+
+def git_auth_environment(token):
+    """
+    Environment variables that make git send `token` to GitHub as an HTTP
+    header. Unlike a token in the remote url, this never shows up in a command
+    line, and so never in a GitCommandError message shown to users.
+    """
+    credentials = base64.b64encode(f'x-access-token:{token}'.encode()).decode()
+    return {
+        'GIT_CONFIG_COUNT': '1',
+        'GIT_CONFIG_KEY_0': 'http.https://github.com/.extraheader',
+        'GIT_CONFIG_VALUE_0': f'Authorization: Basic {credentials}',
+        'GIT_TERMINAL_PROMPT': '0',
+    }
+
+
+def push_git_mirror(website, site_dir, user, repo, progress):
+    """
+    Bring the website's git mirror up to date with the remote branch, replace
+    its working tree with `site_dir` and push what changed as a fast-forward.
+    Returns the number of changed files (0 when nothing was pushed).
+    """
+    remote_url = f"https://github.com/{repo.owner.login}/{repo.name}.git"
+    auth = git_auth_environment(settings.GITHUB_TOKEN)
+    tracking_ref = f'refs/remotes/origin/{PUBLISH_BRANCH}'
+    git_repo = open_git_mirror(website, repo.clone_url)
+    try:
+        with git_repo.config_writer() as config:
+            config.set_value("user", "name", user.login)
+            config.set_value("user", "email", user.email or f"{user.login}@users.noreply.github.com")
+
+        progress('Fetching repository', 72)
+        remote_heads = git_repo.git.ls_remote(remote_url, f'refs/heads/{PUBLISH_BRANCH}', env=auth).split()
+        if remote_heads:
+            remote_head = remote_heads[0]
+            try:
+                known = git_repo.git.rev_parse('--verify', '--quiet', tracking_ref) == remote_head
+            except git.GitCommandError:
+                known = False
+            if not known:
+                git_repo.git.fetch(remote_url, f'+refs/heads/{PUBLISH_BRANCH}:{tracking_ref}', env=auth)
+            # --mixed moves the branch and index only; the working tree is hard-linked
+            # to the build cache and must never be checked out over
+            git_repo.git.reset('--mixed', '--quiet', tracking_ref)
+        elif git_repo.head.is_valid():
+            # The remote branch is gone (e.g. an emptied repository): start a new history
+            git_repo.git.update_ref('-d', 'HEAD')
+
+        progress('Committing changes', 78)
+        mirror_tree(site_dir, git_repo.working_tree_dir, keep={'.git'})
+        git_repo.git.add(A=True)
+        changed = git_repo.git.diff('--cached', '--name-only').splitlines()
+        if not changed:
+            return 0
+        git_repo.index.commit(f"Update site: {website.name}")
+        progress(f'Pushing {len(changed)} changed file(s) to GitHub', 85)
+        # Not forced: the commit sits on top of the remote branch, so this is a fast-forward
+        git_repo.git.push(remote_url, f'HEAD:refs/heads/{PUBLISH_BRANCH}', env=auth)
+        git_repo.git.update_ref(tracking_ref, 'HEAD')
+        return len(changed)
+    finally:
+        git_repo.close()
+
+
+def git_blob_sha(data):
+    """The object id git gives a blob with this content."""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+def local_git_tree(site_dir):
+    """Map every file under `site_dir` to its git (mode, blob sha), keyed by its path in the repository."""
+    tree = {}
+    for root, dirs, files in os.walk(site_dir):
+        dirs[:] = [name for name in dirs if name != '.git']
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                sha = git_blob_sha(f.read())
+            mode = '100755' if os.access(path, os.X_OK) else '100644'
+            tree[os.path.relpath(path, site_dir).replace(os.sep, '/')] = (mode, sha)
+    return tree
+
+
+def remote_git_tree(repo):
+    """
+    Return (head commit, {path: (mode, blob sha)}) of the publish branch, or
+    (None, {}) when the repository has no such branch yet. GitHub answers 409
+    for a repository without any commit.
+    """
+    try:
+        ref = repo.get_git_ref(f'heads/{PUBLISH_BRANCH}')
+    except GithubException as e:
+        if e.status == 404:
+            return None, {}
+        raise
+    head = repo.get_git_commit(ref.object.sha)
+    tree = repo.get_git_tree(head.tree.sha, recursive=True)
+    if tree.raw_data.get('truncated'):
+        # Too large to list in one response: walk it one directory at a time
+        return head, walk_git_tree(repo, head.tree.sha)
+    return head, {entry.path: (entry.mode, entry.sha) for entry in tree.tree if entry.type == 'blob'}
+
+
+def walk_git_tree(repo, sha, prefix=''):
+    """List the blobs of a remote tree directory by directory, as {path: (mode, blob sha)}."""
+    tree = repo.get_git_tree(sha)
+    if tree.raw_data.get('truncated'):
+        raise Exception(f"GitHub truncated the listing of {prefix or 'the repository root'}")
+    blobs = {}
+    for entry in tree.tree:
+        if entry.type == 'blob':
+            blobs[prefix + entry.path] = (entry.mode, entry.sha)
+        elif entry.type == 'tree':
+            blobs.update(walk_git_tree(repo, entry.sha, f'{prefix}{entry.path}/'))
+    return blobs
+
+
+def push_git_data_api(website, site_dir, repo, progress):
+    """
+    Publish `site_dir` through the GitHub Git Data API instead of git: blob ids
+    are computed locally and compared with the remote tree, only blobs GitHub
+    does not have are uploaded (concurrently), and one tree and one commit are
+    created on top of the branch. Returns the number of changed files.
+    """
+    progress('Comparing with repository', 72)
+    local = local_git_tree(site_dir)
+    try:
+        head, remote = remote_git_tree(repo)
+    except GithubException as e:
+        if e.status != 409:
+            raise
+        # Git Data endpoints reject a repository without any commit; give it a first one
+        repo.create_file('.gitkeep', 'Initialize repository', '', branch=PUBLISH_BRANCH)
+        head, remote = remote_git_tree(repo)
+    changed = sorted(path for path, entry in local.items() if remote.get(path) != entry)
+    deleted = sorted(set(remote) - set(local))
+    if not changed and not deleted:
+        return 0
+
+    known_blobs = {sha for mode, sha in remote.values()}
+    missing = sorted({local[path][1]: path for path in changed if local[path][1] not in known_blobs}.items())
+    progress(f'Uploading {len(missing)} file(s) to GitHub', 80)
+
+    def upload(item):
+        sha, path = item
+        with open(os.path.join(site_dir, path), 'rb') as f:
+            blob = repo.create_git_blob(base64.b64encode(f.read()).decode(), 'base64')
+        if blob.sha != sha:
+            raise Exception(f"GitHub stored {path} as {blob.sha}, expected {sha}")
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(BLOB_UPLOAD_WORKERS, len(missing))) as pool:
+            list(pool.map(upload, missing))
+
+    progress('Committing changes', 90)
+    elements = [InputGitTreeElement(path, local[path][0], 'blob', sha=local[path][1]) for path in changed]
+    elements += [InputGitTreeElement(path, remote[path][0], 'blob', sha=None) for path in deleted]
+    if head:
+        tree = repo.create_git_tree(elements, base_tree=head.tree)
+    else:
+        tree = repo.create_git_tree(elements)
+    commit = repo.create_git_commit(f"Update site: {website.name}", tree, [head] if head else [])
+    if head:
+        # Not forced: fails if the branch moved since it was read
+        repo.get_git_ref(f'heads/{PUBLISH_BRANCH}').edit(commit.sha)
+    else:
+        repo.create_git_ref(f'refs/heads/{PUBLISH_BRANCH}', commit.sha)
+    return len(changed) + len(deleted)
+
+
+def publish_to_github(website, repo_name=None, existing_repo_selected=None, progress=None, mode='django'):
+    """
+    Build `website` in the given build mode and push it to GitHub, then record
+    the connected repository on the website. Returns the repository's full name.
+
+    The site is published from a persistent clone (see push_git_mirror), or
+    with GITHUB_PUBLISH_ENGINE='api' through the Git Data API (see
+    push_git_data_api); either way only the files that changed are uploaded.
+    """
+    progress = progress or (lambda stage, percent: None)
+    progress('Connecting to GitHub', 5)
+    user, repo = resolve_github_repo(website, repo_name, existing_repo_selected)
+
+    site_dir = build_website(website, progress=lambda stage, percent: progress(stage, 10 + percent * 0.6), mode=mode)
+    with build_lock(website.id):
+        if getattr(settings, 'GITHUB_PUBLISH_ENGINE', 'git') == 'api':
+            push_git_data_api(website, site_dir, repo, progress)
+        else:
+            push_git_mirror(website, site_dir, user, repo, progress)
+
+    website.github_repo = repo.clone_url
+    website.is_public_repo = not repo.private  # Use the actual repository privacy setting
+    website.save()
+    return repo.full_name
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Page, invalidate_nofollow_urls
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    # Only nofollow pages (before or after the save) can change the nofollow set;
+    # a deferred flag was not loaded, so the save did not change it
+    nofollow = instance.__dict__.get('nofollow_document')
+    if nofollow or instance._saved_nofollow:
+        invalidate_nofollow_urls(instance.website_id)
+    instance._saved_nofollow = nofollow
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    if instance.nofollow_document:
+        invalidate_nofollow_urls(instance.website_id)
@@ -1,3 +1,619 @@
-from django.test import TestCase
+import base64
+import hashlib
+import io
+import os
+import runpy
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import unquote
 
-# Create your tests here.
+from bs4 import BeautifulSoup
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import reverse
+from github import GithubException, InputGitTreeElement
+from PIL import Image
+
+from .images import ResponsiveImages
+from .media import MediaCache, rewrite_images
+from .forms import PageForm
+from .builder import SiteBuilder, file_digest
+from .jobs import claim_next_job, run_job
+from .models import STAGED_UPLOAD_URL, BuildJob, Menu, Page, nofollow_urls, SlugAllocator, UploadedAsset, Website
+from .publishing import PUBLISH_BRANCH, git_blob_sha, local_git_tree, push_git_data_api
+
+
+def create_website(owner='owner', **fields):
+    owner, _ = User.objects.get_or_create(username=owner)
+    fields = {'name': 'Site', 'domain': 'example.com', 'phone_number_display': '555', 'phone_number_link': '+1555', **fields}
+    return Website.objects.create(owner=owner, **fields)
+
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+class ResponsiveImagesTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.cache = MediaCache(root=self.root)
+
+    def add_image(self, width, height, name='source'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, format='JPEG')
+        path = f'{self.root}/source.jpg'
+        with open(path, 'wb') as f:
+            f.write(buffer.getvalue())
+        return self.cache.add_file(path, name)
+
+    def test_source_wider_than_largest_width(self):
+        filename = self.add_image(2400, 1200)
+        record = ResponsiveImages(self.cache, widths=[480, 960, 1600]).variants(filename)
+        for variants in record['sources'].values():
+            self.assertEqual([width for width, name in variants], [480, 960, 1600])
+
+    def test_source_narrower_than_largest_width(self):
+        filename = self.add_image(1200, 600)
+        record = ResponsiveImages(self.cache, widths=[480, 960, 1600]).variants(filename)
+        for variants in record['sources'].values():
+            self.assertEqual([width for width, name in variants], [480, 960, 1200])
+
+    def test_srcset_quotes_names_with_spaces_and_commas(self):
+        src = 'https://res.cloudinary.com/demo/my%20photo,%20final.jpg'
+        filename = self.add_image(1200, 600, name='my photo, final')
+        images = ResponsiveImages(self.cache, widths=[480, 960]).prepare_all([filename])
+        content, used = rewrite_images(BeautifulSoup(f'<img src="{src}">', 'html.parser'), {src: filename}, images)
+        picture = BeautifulSoup(content, 'html.parser').picture
+        img = picture.img
+        self.assertEqual(unquote(img['src']), f'/media/websites/{used[-1]}')
+        for srcset in [img['srcset']] + [source['srcset'] for source in picture.find_all('source')]:
+            candidates = [candidate.split(' ') for candidate in srcset.split(', ')]
+            self.assertEqual([width for url, width in candidates], ['480w', '960w'])
+            for url, width in candidates:
+                self.assertNotIn(',', url)
+                self.assertIn(unquote(url).removeprefix('/media/websites/'), used)
+
+
+class FakeGitDataRepo:
+    """
+    In-memory stand-in for the Git Data endpoints of a PyGithub Repository.
+    Trees are stored flat as {path: (mode, blob sha)}; with `truncate` set, a
+    recursive listing is cut short the way GitHub does for very large trees.
+    """
+
+    def __init__(self, truncate=False):
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        self.refs = {}
+        self.uploads = []
+        self.truncate = truncate
+
+    def get_git_ref(self, ref):
+        name = 'refs/' + ref
+        if not self.refs:
+            raise GithubException(409, {'message': 'Git Repository is empty.'}, None)
+        if name not in self.refs:
+            raise GithubException(404, {'message': 'Not Found'}, None)
+        return SimpleNamespace(object=SimpleNamespace(sha=self.refs[name]), edit=lambda sha: self._move_ref(name, sha))
+
+    def _move_ref(self, name, sha):
+        assert self.commits[sha]['parents'] == [self.refs[name]], 'not a fast-forward'
+        self.refs[name] = sha
+
+    def create_git_ref(self, ref, sha):
+        self.refs[ref] = sha
+
+    def create_file(self, path, message, content, branch):
+        # Contents API: the only way to give an empty repository its first commit
+        data = content.encode()
+        self.blobs[git_blob_sha(data)] = data
+        tree = self.create_git_tree([InputGitTreeElement(path, '100644', 'blob', sha=git_blob_sha(data))])
+        self.create_git_ref(f'refs/heads/{branch}', self.create_git_commit(message, tree, []).sha)
+
+    def get_git_commit(self, sha):
+        return SimpleNamespace(sha=sha, tree=SimpleNamespace(sha=self.commits[sha]['tree']))
+
+    def get_git_tree(self, sha, recursive=False):
+        # Subtrees are addressed as '<root tree sha>:<directory>/'
+        root, _, prefix = sha.partition(':')
+        files = self.trees[root]
+        if recursive:
+            entries = [SimpleNamespace(path=path, mode=mode, sha=blob, type='blob') for path, (mode, blob) in sorted(files.items())]
+            if self.truncate:
+                entries = entries[:1]
+            return SimpleNamespace(raw_data={'truncated': self.truncate}, tree=entries)
+        entries = {}
+        for path, (mode, blob) in files.items():
+            if not path.startswith(prefix):
+                continue
+            name, slash, rest = path[len(prefix):].partition('/')
+            if slash:
+                entries[name] = SimpleNamespace(path=name, mode='040000', sha=f'{root}:{prefix}{name}/', type='tree')
+            else:
+                entries[name] = SimpleNamespace(path=name, mode=mode, sha=blob, type='blob')
+        return SimpleNamespace(raw_data={'truncated': False}, tree=list(entries.values()))
+
+    def create_git_blob(self, content, encoding):
+        data = base64.b64decode(content)
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        self.uploads.append(sha)
+        return SimpleNamespace(sha=sha)
+
+    def create_git_tree(self, elements, base_tree=None):
+        files = dict(self.trees[base_tree.sha]) if base_tree else {}
+        for element in elements:
+            entry = element._identity
+            if entry['sha'] is None:
+                del files[entry['path']]
+            else:
+                assert entry['sha'] in self.blobs, f"unknown blob for {entry['path']}"
+                files[entry['path']] = (entry['mode'], entry['sha'])
+        sha = hashlib.sha1(repr(sorted(files.items())).encode()).hexdigest()
+        self.trees[sha] = files
+        return SimpleNamespace(sha=sha)
+
+    def create_git_commit(self, message, tree, parents):
+        sha = hashlib.sha1(f'{tree.sha}{[parent.sha for parent in parents]}{len(self.commits)}'.encode()).hexdigest()
+        self.commits[sha] = {'tree': tree.sha, 'parents': [parent.sha for parent in parents]}
+        return SimpleNamespace(sha=sha)
+
+    def head_tree(self):
+        return self.trees[self.commits[self.refs[f'refs/heads/{PUBLISH_BRANCH}']]['tree']]
+
+
+class GitDataPublishTests(SimpleTestCase):
+    def setUp(self):
+        self.site_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.site_dir, ignore_errors=True)
+        self.write('index.html', '<h1>Home</h1>')
+        self.write('about/index.html', '<h1>About</h1>')
+        self.write('static/css/site.css', 'body { margin: 0 }')
+        self.repo = FakeGitDataRepo()
+        self.publish()
+
+    def write(self, path, content):
+        path = os.path.join(self.site_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def publish(self):
+        self.repo.uploads = []
+        return push_git_data_api(SimpleNamespace(name='Site'), self.site_dir, self.repo, lambda stage, percent: None)
+
+    def test_unchanged_site_uploads_nothing(self):
+        commits = len(self.repo.commits)
+        self.assertEqual(self.publish(), 0)
+        self.assertEqual(self.repo.uploads, [])
+        self.assertEqual(len(self.repo.commits), commits)
+
+    def test_edit_uploads_only_changed_blobs(self):
+        self.write('about/index.html', '<h1>About us</h1>')
+        self.assertEqual(self.publish(), 1)
+        self.assertEqual(self.repo.uploads, [git_blob_sha(b'<h1>About us</h1>')])
+        self.assertEqual(self.repo.head_tree(), local_git_tree(self.site_dir))
+
+    def test_deleted_file_is_removed_from_tree(self):
+        os.remove(os.path.join(self.site_dir, 'about/index.html'))
+        self.assertEqual(self.publish(), 1)
+        self.assertEqual(self.repo.uploads, [])
+        self.assertNotIn('about/index.html', self.repo.head_tree())
+        self.assertEqual(self.repo.head_tree(), local_git_tree(self.site_dir))
+
+    def test_deleted_file_is_removed_from_truncated_tree(self):
+        self.repo.truncate = True
+        os.remove(os.path.join(self.site_dir, 'static/css/site.css'))
+        self.assertEqual(self.publish(), 1)
+        self.assertEqual(self.repo.uploads, [])
+        self.assertEqual(self.repo.head_tree(), local_git_tree(self.site_dir))
+
+
+class UploadStagingTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.media_root = os.path.join(root, 'media')
+        settings = override_settings(
+            CKEDITOR_UPLOAD_BACKEND='local',
+            CKEDITOR_UPLOAD_MAX_WIDTH=800,
+            UPLOAD_STAGING_ROOT=os.path.join(root, 'staging'),
+            MEDIA_ROOT=self.media_root,
+            BUILD_JOBS_EAGER=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.website = create_website()
+
+    def upload(self, name='knee_pain.png'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 900), (40, 120, 200)).save(buffer, format='PNG')
+        response = self.client.post(reverse('ckeditor_upload'), {
+            'upload': SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png'),
+            'website_id': self.website.id,
+        })
+        return response.json()
+
+    def test_worker_stores_upload_and_swaps_url_into_pages(self):
+        result = self.upload()
+        self.assertEqual(result['uploaded'], 1)
+        self.assertEqual(result['alt'], 'Knee Pain')
+        staged_url = result['url']
+        self.assertTrue(staged_url.startswith(STAGED_UPLOAD_URL))
+        response = self.client.get(staged_url)
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (800, 450))
+        page = Page.objects.create(website=self.website, title='Knee', content=f'<img src="{staged_url}">')
+
+        call_command('run_build_worker', '--once', stdout=io.StringIO())
+
+        asset = UploadedAsset.objects.get()
+        self.assertEqual(asset.status, 'uploaded')
+        self.assertTrue(asset.url.startswith('/media/uploads/'))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'uploads', asset.file_name)))
+        page.refresh_from_db()
+        self.assertEqual(page.content, f'<img src="{asset.url}">')
+        self.assertRedirects(self.client.get(staged_url), asset.url, status_code=301, fetch_redirect_response=False)
+
+    def test_identical_upload_reuses_stored_asset(self):
+        first = self.upload()
+        call_command('run_build_worker', '--once', stdout=io.StringIO())
+        second = self.upload('copy.png')
+        asset = UploadedAsset.objects.get()
+        self.assertEqual(second['url'], asset.url)
+        self.assertNotEqual(second['url'], first['url'])
+
+
+class BuildJobTests(TestCase):
+    def setUp(self):
+        self.website = create_website()
+        BuildJob.enqueue(self.website, 'export')
+
+    def test_outcome_is_recorded(self):
+        job = claim_next_job()
+        with mock.patch.dict('websites.jobs.JOB_HANDLERS', {'export': lambda job: 'Done.'}):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.message, job.progress), ('succeeded', 'Done.', 100))
+
+    def test_outcome_of_requeued_run_is_dropped(self):
+        first = claim_next_job()
+        runs = []
+
+        def handler(job):
+            if not runs:
+                # Taken for a dead worker while still running, and claimed by another worker
+                BuildJob.objects.filter(pk=job.pk).update(status='queued')
+                runs.append(claim_next_job())
+                return 'First run'
+            return 'Second run'
+
+        with mock.patch.dict('websites.jobs.JOB_HANDLERS', {'export': handler}):
+            run_job(first)
+            second = BuildJob.objects.get()
+            self.assertEqual(second.status, 'running')
+            self.assertEqual(second.started_at, runs[0].started_at)
+            first.report('Late progress', 50)
+            self.assertEqual(BuildJob.objects.get().stage, 'Starting')
+            run_job(runs[0])
+        job = BuildJob.objects.get()
+        self.assertEqual((job.status, job.message), ('succeeded', 'Second run'))
+
+    def test_worker_runs_jobs_between_uploads(self):
+        BuildJob.enqueue(create_website('other'), 'export')
+        uploads = [SimpleNamespace(name=f'upload-{i}', message='') for i in range(25)]
+        order = []
+
+        def finish(asset):
+            order.append(asset.name)
+            return asset
+
+        def run(job):
+            order.append('job')
+            job.status = 'succeeded'
+            job.save()
+            return job
+
+        worker = 'websites.management.commands.run_build_worker'
+        with mock.patch(f'{worker}.claim_next_upload', lambda: uploads.pop(0) if uploads else None), \
+                mock.patch(f'{worker}.finish_upload', finish), mock.patch(f'{worker}.run_job', run):
+            call_command('run_build_worker', '--once', stdout=io.StringIO())
+        self.assertEqual([i for i, name in enumerate(order) if name == 'job'], [10, 21])
+        self.assertEqual(len(order), 27)
+
+
+class PageTreeTests(TestCase):
+    def setUp(self):
+        self.website = create_website()
+
+    def page(self, slug):
+        return Page.objects.create(website=self.website, title=slug.rsplit('/', 1)[-1].title(), content='', slug=slug)
+
+    def assertInTree(self, page, parent, depth, exists):
+        page.refresh_from_db()
+        self.assertEqual(page.parent, parent)
+        self.assertEqual(page.depth, depth)
+        self.assertEqual([crumb['exists'] for crumb in page.breadcrumb], exists)
+
+    def test_create_links_nearest_existing_ancestor(self):
+        services = self.page('services')
+        metal = self.page('/services/roofing/metal/')
+        self.assertEqual(metal.path, 'services/roofing/metal')
+        self.assertInTree(metal, services, 2, [True, True, False, True])
+        self.assertEqual([crumb['url'] for crumb in metal.breadcrumb], ['/', '/services/', '/services/roofing/', '/services/roofing/metal/'])
+
+    def test_new_intermediate_page_adopts_descendants(self):
+        services = self.page('services')
+        metal = self.page('services/roofing/metal')
+        sibling = self.page('services/roofing-repair')
+        roofing = self.page('services/roofing')
+        self.assertInTree(roofing, services, 1, [True, True, True])
+        self.assertInTree(metal, roofing, 2, [True, True, True, True])
+        self.assertInTree(sibling, services, 1, [True, True, True])
+
+    def test_rename_moves_page_and_its_descendants(self):
+        services = self.page('services')
+        roofing = self.page('services/roofing')
+        metal = self.page('services/roofing/metal')
+        blog = self.page('blog')
+        roofing.slug = 'blog/roofing'
+        roofing.save()
+        self.assertInTree(roofing, blog, 1, [True, True, True])
+        self.assertInTree(metal, services, 2, [True, True, False, True])
+
+    def test_reparent_by_changing_slug(self):
+        self.page('services')
+        blog = self.page('blog')
+        post = self.page('services/post')
+        post.slug = 'blog/post'
+        post.save()
+        self.assertInTree(post, blog, 1, [True, True, True])
+
+    def test_delete_reattaches_children_to_nearest_ancestor(self):
+        services = self.page('services')
+        roofing = self.page('services/roofing')
+        metal = self.page('services/roofing/metal')
+        roofing.delete()
+        self.assertInTree(metal, services, 2, [True, True, False, True])
+        services.delete()
+        self.assertInTree(metal, None, 2, [True, False, False, True])
+
+
+class PageTreeMigrationTests(TransactionTestCase):
+    before = [('websites', '0012_uploaded_asset_sha256')]
+    after = [('websites', '0013_page_tree')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill_builds_tree(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        owner = apps.get_model('auth', 'User').objects.create(username='owner')
+        website = apps.get_model('websites', 'Website').objects.create(
+            name='Site', domain='example.com', phone_number_display='555', phone_number_link='+1555', owner=owner
+        )
+        OldPage = apps.get_model('websites', 'Page')
+        for slug in ['home', 'services', '/services/roofing/metal/', 'services/roofing']:
+            OldPage.objects.create(website=website, title=slug, content='', slug=slug)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        Page = executor.loader.project_state(self.after).apps.get_model('websites', 'Page')
+        pages = {page.path: page for page in Page.objects.all()}
+        self.assertEqual(set(pages), {'home', 'services', 'services/roofing', 'services/roofing/metal'})
+        metal = pages['services/roofing/metal']
+        self.assertEqual((metal.parent_id, metal.depth), (pages['services/roofing'].id, 2))
+        self.assertEqual(pages['services/roofing'].parent_id, pages['services'].id)
+        self.assertEqual((pages['home'].parent_id, pages['home'].depth), (None, 0))
+        self.assertEqual([crumb['url'] for crumb in metal.breadcrumb], ['/', '/services/', '/services/roofing/', '/services/roofing/metal/'])
+        self.assertTrue(all(crumb['exists'] for crumb in metal.breadcrumb))
+
+
+class SlugAllocationTests(TestCase):
+    def setUp(self):
+        self.website = create_website()
+
+    def page(self, title, slug='', website=None):
+        return Page.objects.create(website=website or self.website, title=title, content='', slug=slug)
+
+    def test_taken_slug_gets_next_suffix(self):
+        for slug in ['area', 'area-2', 'area-x', 'areas', 'area/sub']:
+            self.page('Other', slug)
+        self.assertEqual(self.page('Area').slug, 'area-3')
+        self.assertEqual(self.page('Area').slug, 'area-4')
+        self.assertEqual(self.page('Fresh').slug, 'fresh')
+
+    def test_slugs_are_scoped_per_website(self):
+        other = create_website(owner='someone', domain='other.com')
+        self.page('Area', website=other)
+        self.page('Area', website=other)
+        self.assertEqual(self.page('Area').slug, 'area')
+
+    def test_resaving_keeps_free_numbered_slug(self):
+        self.page('Area', 'area')
+        page = self.page('Area', 'area-1')
+        self.page('Area', 'area-2')
+        form = PageForm(data={'title': 'Area', 'slug': '', 'content': '<p>x</p>'}, instance=page)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['slug'], 'area-1')
+        form.save()
+        page.refresh_from_db()
+        self.assertEqual(page.slug, 'area-1')
+
+    def test_save_retries_when_slug_is_taken_concurrently(self):
+        self.page('Area', 'area')
+        pages = SlugAllocator.pages
+        calls = []
+
+        def stale_pages(allocator):
+            # The first allocation misses the page above, as if it was created concurrently
+            calls.append(allocator)
+            return Page.objects.none() if len(calls) == 1 else pages(allocator)
+
+        with mock.patch.object(SlugAllocator, 'pages', stale_pages):
+            page = self.page('Area')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(page.slug, 'area-1')
+
+
+class FixDuplicatePageSlugsTests(TransactionTestCase):
+    def setUp(self):
+        # The duplicates the script repairs predate the unique (website, slug) constraint
+        with connection.schema_editor() as editor:
+            editor.alter_unique_together(Page, [('website', 'slug')], [])
+        self.addCleanup(self.restore_constraint)
+
+    def restore_constraint(self):
+        with connection.schema_editor() as editor:
+            editor.alter_unique_together(Page, [], [('website', 'slug')])
+
+    def test_renames_later_duplicates_per_website(self):
+        website = create_website()
+        other = create_website(owner='someone', domain='other.com')
+        first = Page.objects.create(website=website, title='Area', content='', slug='area')
+        duplicates = [Page.objects.create(website=website, title='Area', content='', slug='x') for _ in range(2)]
+        Page.objects.filter(pk__in=[page.pk for page in duplicates]).update(slug='area')
+        Page.objects.create(website=website, title='Area', content='', slug='area-2')
+        elsewhere = Page.objects.create(website=other, title='Area', content='', slug='area')
+
+        with mock.patch('builtins.print'):
+            runpy.run_path(os.path.join(settings.BASE_DIR, 'fix_duplicate_page_slugs.py'))
+
+        slugs = [Page.objects.get(pk=page.pk).slug for page in [first] + duplicates]
+        self.assertEqual(slugs, ['area', 'area-3', 'area-4'])
+        self.assertEqual(Page.objects.get(pk=elsewhere.pk).slug, 'area')
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class IncrementalBuildTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(EXPORT_CACHE_ROOT=os.path.join(root, 'cache'), MEDIA_ROOT=os.path.join(root, 'media'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.website = create_website()
+        self.pages = [
+            Page.objects.create(website=self.website, title=f'Page {i}', content=f'<p>Page {i}</p>', slug=f'page-{i}', is_homepage=i == 0)
+            for i in range(3)
+        ]
+        self.build()
+
+    def build(self):
+        builder = SiteBuilder(Website.objects.get(pk=self.website.pk))
+        self.site_dir = builder.build()
+        self.pages_dir = builder.pages_dir
+        return builder.stats
+
+    def stored_page(self, page):
+        with open(os.path.join(self.site_dir, 'static_site', 'pages', f'{page.id}.json')) as f:
+            return f.read()
+
+    def test_unchanged_site_reuses_every_page(self):
+        stats = self.build()
+        self.assertFalse(stats['full_rebuild'])
+        self.assertEqual((stats['pages_processed'], stats['pages_reused'], stats['files_written']), (0, 3, 0))
+
+    def test_edit_rebuilds_only_that_page(self):
+        page = self.pages[1]
+        page.content = '<p>Edited</p>'
+        page.save()
+        stats = self.build()
+        self.assertFalse(stats['full_rebuild'])
+        self.assertEqual((stats['pages_processed'], stats['pages_reused']), (1, 2))
+        self.assertIn('Edited', self.stored_page(page))
+
+    def test_menu_change_rebuilds_everything(self):
+        Menu.objects.create(website=self.website, type='header', content='[Home](/)')
+        stats = self.build()
+        self.assertTrue(stats['full_rebuild'])
+        self.assertEqual((stats['pages_processed'], stats['pages_reused']), (3, 0))
+
+    def test_settings_change_rebuilds_everything(self):
+        self.website.form_cta1 = 'Call now'
+        self.website.save()
+        stats = self.build()
+        self.assertTrue(stats['full_rebuild'])
+        self.assertEqual(stats['pages_processed'], 3)
+
+    def test_template_change_rebuilds_everything(self):
+        def digest(path):
+            return 'changed' if path.endswith('static_views.py') else file_digest(path)
+
+        with mock.patch('websites.builder.file_digest', digest):
+            stats = self.build()
+        self.assertTrue(stats['full_rebuild'])
+        self.assertEqual(stats['pages_processed'], 3)
+
+    def test_deleted_page_output_is_removed(self):
+        page = self.pages[2]
+        page.delete()
+        stats = self.build()
+        self.assertFalse(stats['full_rebuild'])
+        self.assertEqual((stats['pages_processed'], stats['pages_reused']), (0, 2))
+        for path in [
+            os.path.join(self.site_dir, 'static_site', 'pages', f'{page.id}.json'),
+            os.path.join(self.pages_dir, f'{page.id}.json'),
+            os.path.join(self.pages_dir, f'{page.id}.final.json'),
+        ]:
+            self.assertFalse(os.path.exists(path), path)
+        with open(os.path.join(self.site_dir, 'static_site', 'pages', 'index.json')) as f:
+            self.assertNotIn('page-2', f.read())
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class NofollowUrlsTests(TestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.website = create_website()
+        self.page = Page.objects.create(website=self.website, title='Plain', slug='plain')
+
+    def cached_key(self):
+        return f"nofollow:{self.website.id}:{caches['shared'].get(f'nofollow-version:{self.website.id}')}"
+
+    def test_page_changes_replace_the_cached_set(self):
+        self.assertEqual(nofollow_urls(self.website.id), frozenset())
+        first = self.cached_key()
+        hidden = Page.objects.create(website=self.website, title='Hidden', slug='hidden', nofollow_document=True)
+        self.assertEqual(nofollow_urls(self.website.id), {'/hidden'})
+
+        hidden.nofollow_document = False
+        hidden.save()
+        self.assertEqual(nofollow_urls(self.website.id), frozenset())
+        hidden.nofollow_document = True
+        hidden.save()
+        self.assertEqual(nofollow_urls(self.website.id), {'/hidden'})
+
+        before_delete = self.cached_key()
+        hidden.delete()
+        self.assertEqual(nofollow_urls(self.website.id), frozenset())
+        # Each change drops the set it replaced rather than leaving it behind
+        self.assertIsNone(caches['shared'].get(first))
+        self.assertIsNone(caches['shared'].get(before_delete))
+        self.assertEqual(caches['shared'].get(self.cached_key()), frozenset())
+
+    def test_unrelated_save_keeps_the_cached_set(self):
+        Page.objects.create(website=self.website, title='Hidden', slug='hidden', nofollow_document=True)
+        nofollow_urls(self.website.id)
+        key = self.cached_key()
+        self.page.content = '<p>Edited</p>'
+        self.page.save()
+        self.assertEqual(self.cached_key(), key)
+        with self.assertNumQueries(0):
+            self.assertEqual(nofollow_urls(self.website.id), {'/hidden'})
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import traceback
+from datetime import timedelta
+
+import cloudinary.uploader
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from .images import optimize_upload
+from .models import Page, UploadedAsset
+
+# Uploads stuck in 'uploading' this long belong to a worker that died
+STALE_UPLOAD_TIMEOUT = timedelta(minutes=10)
+
+
+def staging_dir():
+    path = settings.UPLOAD_STAGING_ROOT
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def staged_path(file_name):
+    return os.path.join(staging_dir(), os.path.basename(file_name))
+
+
+def upload_digest(upload_file):
+    digest = hashlib.sha256()
+    for chunk in upload_file.chunks():
+        digest.update(chunk)
+    upload_file.seek(0)
+    return digest.hexdigest()
+
+
+def stage_upload(upload_file, public_id, ext, website=None):
+    """
+    Process an uploaded image (see images.optimize_upload) and keep it in the
+    staging directory until the worker stores it. A file that was uploaded
+    before is not processed or stored again; its existing asset is returned.
+    Returns (asset, created).
+    """
+    sha256 = upload_digest(upload_file)
+    existing = UploadedAsset.objects.filter(sha256=sha256).exclude(status='failed').order_by('created_at').first()
+    if existing:
+        return existing, False
+
+    max_width = getattr(settings, 'CKEDITOR_UPLOAD_MAX_WIDTH', 2000)
+    processed = optimize_upload(upload_file, max_width)
+    if processed:
+        data, ext = processed
+    else:
+        upload_file.seek(0)
+        data = upload_file.read()
+    file_name = f"{public_id}.{ext}"
+    path = staged_path(file_name)
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.part', path)
+    asset = UploadedAsset.objects.create(website=website, public_id=public_id, file_name=file_name, sha256=sha256)
+    return asset, True
+
+
+def store_upload(asset):
+    """Store a staged file in its final location and return its URL."""
+    path = staged_path(asset.file_name)
+    if getattr(settings, 'CKEDITOR_UPLOAD_BACKEND', 'cloudinary') == 'local':
+        storage = FileSystemStorage(location=settings.MEDIA_ROOT, base_url=settings.MEDIA_URL)
+        with open(path, 'rb') as f:
+            name = storage.save(f"{settings.CKEDITOR_UPLOAD_PATH}{asset.file_name}", File(f))
+        return storage.url(name)
+    ext = os.path.splitext(asset.file_name)[1].lstrip('.')
+    result = cloudinary.uploader.upload(path, public_id=asset.public_id, resource_type="image", format=ext)
+    return result['secure_url']
+
+
+def swap_staged_url(asset):
+    """
+    Point every page that still references the staged file at its final URL,
+    on any website since identical uploads share one asset. Returns the number of pages.
+    """
+    count = 0
+    for page in Page.objects.filter(content__contains=asset.staged_url):
+        page.content = page.content.replace(asset.staged_url, asset.url)
+        page.save()
+        count += 1
+    return count
+
+
+def finish_upload(asset):
+    """Upload a claimed asset, swap its URL into pages and drop the staged copy."""
+    try:
+        asset.url = store_upload(asset)
+        asset.status = 'uploaded'
+        asset.message = ''
+        asset.save()
+    except Exception as e:
+        traceback.print_exc()
+        asset.status = 'failed'
+        asset.message = f'Upload failed: {e}'
+        asset.save()
+        return asset
+    swap_staged_url(asset)
+    try:
+        os.remove(staged_path(asset.file_name))
+    except OSError:
+        pass
+    return asset
+
+
+def claim_next_upload():
+    """Atomically move the oldest staged upload to 'uploading' and return it, or None."""
+    while True:
+        asset = UploadedAsset.objects.filter(status='staged').order_by('created_at').first()
+        if asset is None:
+            return None
+        claimed = UploadedAsset.objects.filter(pk=asset.pk, status='staged').update(
+            status='uploading', updated_at=timezone.now()
+        )
+        if claimed:
+            asset.refresh_from_db()
+            return asset
+
+
+def requeue_stale_uploads():
+    cutoff = timezone.now() - STALE_UPLOAD_TIMEOUT
+    return UploadedAsset.objects.filter(status='uploading', updated_at__lt=cutoff).update(status='staged')
+
+
+def open_staged(file_name):
+    """Open a staged file for serving, or return None if it is gone."""
+    try:
+        return open(staged_path(file_name), 'rb')
+    except OSError:
+        return None
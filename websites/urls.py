@@ -6,10 +6,14 @@ urlpatterns = [
     path('create/', views.create_website, name='create_website'),
     path('edit/<int:website_id>/', views.edit_website, name='edit_website'),
     path('pages/<int:website_id>/', views.manage_pages, name='manage_pages'),
+    path('pages/<int:website_id>/children/', views.page_children, name='page_children'),
     path('pages/<int:website_id>/create/', views.create_page, name='create_page'),
     path('pages/<int:website_id>/edit/<int:page_id>/', views.edit_page, name='edit_page'),
     path('export/<int:website_id>/', views.export_website, name='export_website'),
     path('github/<int:website_id>/', views.github_integration, name='github_integration'),
+    path('github/repos/', views.github_repos, name='github_repos'),
+    path('builds/<int:job_id>/status/', views.build_status, name='build_status'),
+    path('builds/<int:job_id>/download/', views.download_build, name='download_build'),
     path('website/<int:website_id>/export/', views.export_website, name='export_website'),
     path('website/<int:website_id>/delete/', views.delete_website, name='delete_website'),
     path('website/<int:website_id>/page/<int:page_id>/delete/', views.delete_page, name='delete_page'),
@@ -19,4 +23,5 @@ urlpatterns = [
     path('settings/<int:website_id>/tracking/', views.tracking_settings, name='tracking_settings'),
     path('settings/<int:website_id>/form/', views.form_settings, name='form_settings'),
     path('settings/<int:website_id>/author/', views.edit_author, name='edit_author'),
+    path('uploads/staged/<str:file_name>', views.staged_upload, name='staged_upload'),
 ] 
\ No newline at end of file